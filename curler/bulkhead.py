@@ -0,0 +1,72 @@
+from collections import deque
+from twisted.internet import defer
+
+
+def parse_concurrency(value):
+    """Parse 'method=N,method=P%,...' into a dict of method -> limit.
+
+    Limits are either a number of jobs (int) or a share of the worker pool
+    (float between 0 and 1). Raises ValueError for limits which would never
+    let a job run."""
+    limits = {}
+    if not value:
+        return limits
+    for item in value.split(','):
+        name, limit = item.rsplit('=', 1)
+        if limit.endswith('%'):
+            limits[name] = float(limit[:-1]) / 100
+            if not 0 < limits[name] <= 1:
+                raise ValueError('share for %s must be above 0%% and at '
+                                 'most 100%%' % name)
+        else:
+            limits[name] = int(limit)
+            if limits[name] < 1:
+                raise ValueError('limit for %s must be at least 1' % name)
+    return limits
+
+
+class Bulkhead(object):
+    """Caps how many jobs for each method may run at once.
+
+    Jobs over the cap wait in a per-method queue. Once `queue_size` jobs
+    are waiting for a method the bulkhead is full, and callers should stop
+    taking new jobs so a slow method can't end up holding every worker."""
+
+    def __init__(self, limits, queue_size):
+        self.limits = limits
+        self.queue_size = queue_size
+        self.running = {}
+        self.waiting = {}
+
+    def limit(self, method, pool_size):
+        limit = self.limits.get(method)
+        if isinstance(limit, float):
+            return max(int(limit * pool_size), 1)
+        return limit
+
+    def acquire(self, method, pool_size):
+        """Get a slot for the method. Returns a deferred which fires once
+        the job may run."""
+        limit = self.limit(method, pool_size)
+        running = self.running.get(method, 0)
+        if limit is None or running < limit:
+            self.running[method] = running + 1
+            return defer.succeed(None)
+
+        d = defer.Deferred()
+        self.waiting.setdefault(method, deque()).append(d)
+        return d
+
+    def full(self):
+        """Whether any method has a full wait queue."""
+        return any(len(waiting) >= self.queue_size
+                   for waiting in self.waiting.values() if waiting)
+
+    def release(self, method):
+        """Give back a slot, letting the next waiting job for it run."""
+        waiting = self.waiting.get(method)
+        if waiting:
+            # slot passes straight to the next job so running is unchanged
+            waiting.popleft().callback(None)
+        else:
+            self.running[method] -= 1
@@ -0,0 +1,27 @@
+"""
+Helpers for gzip compressed backend responses and job results.
+
+Results larger than --compress-results bytes are sent to gearmand gzipped.
+JSON never starts with the gzip magic bytes, so clients can tell the two
+apart with decode_result().
+"""
+
+import zlib
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def gzip(data, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+def decode_result(data):
+    """Get the JSON text of a curler job result, compressed or not."""
+    if data.startswith(GZIP_MAGIC):
+        return gunzip(data)
+    return data
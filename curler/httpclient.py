@@ -0,0 +1,89 @@
+from io import BytesIO
+from urllib.parse import urljoin
+from twisted.internet import defer, reactor
+from twisted.web.client import (Agent, ContentDecoderAgent, FileBodyProducer,
+                                GzipDecoder, HTTPConnectionPool, readBody)
+from twisted.web.error import InfiniteRedirection
+from twisted.web.http_headers import Headers
+
+# we don't want to hear about each connection the pool makes
+HTTPConnectionPool._factory.noisy = False
+
+# Redirects are followed like getPage did: the POST is sent again to the
+# new location, except that 303 See Other is fetched with a GET. Twisted's
+# redirect agents won't re-POST, so this is done by hand.
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+REDIRECT_LIMIT = 20
+
+
+class HTTPBackend(object):
+    """POSTs jobs to HTTP backends with twisted.web's Agent.
+
+    Connections are kept alive and reused between jobs, up to
+    `max_connections` per host. With accept_gzip, gzip encoded responses
+    are asked for and decompressed as they stream in. An endpoint_factory
+    can be given to connect somewhere other than the URL's host."""
+
+    def __init__(self, max_connections, accept_gzip=False,
+                 endpoint_factory=None):
+        self.pool = HTTPConnectionPool(reactor, persistent=True)
+        self.pool.maxPersistentPerHost = max_connections
+        if endpoint_factory is None:
+            self.agent = Agent(reactor, pool=self.pool)
+        else:
+            self.agent = Agent.usingEndpointFactory(reactor, endpoint_factory,
+                                                    pool=self.pool)
+        if accept_gzip:
+            self.agent = ContentDecoderAgent(self.agent,
+                                             [(b'gzip', GzipDecoder)])
+
+    def post(self, url, postdata, headers, timeout=None):
+        """POST to the backend. Fires with (status, headers, response body).
+
+        Header names in the headers dict are lowercase.
+
+        If a timeout is given the request is cancelled once it runs out."""
+        d = self._post(url, postdata, headers)
+        if timeout:
+            call = reactor.callLater(timeout, d.cancel)
+
+            def _done(rv):
+                if call.active():
+                    call.cancel()
+                return rv
+            d.addBoth(_done)
+        return d
+
+    @defer.inlineCallbacks
+    def _post(self, url, postdata, headers):
+        method = b'POST'
+        url = url.encode('ascii')
+        request_headers = Headers(dict((key, [value])
+                                       for key, value in headers.items()))
+        for redirects in range(REDIRECT_LIMIT + 1):
+            body = None
+            if postdata is not None:
+                body = FileBodyProducer(BytesIO(postdata))
+            response = yield self.agent.request(method, url, request_headers,
+                                                body)
+            location = response.headers.getRawHeaders(b'location')
+            if response.code not in REDIRECT_CODES or not location:
+                break
+
+            # read the body so the connection goes back to the pool
+            yield readBody(response)
+            url = urljoin(url, location[0])
+            if response.code == 303:
+                method, postdata = b'GET', None
+        else:
+            raise InfiniteRedirection(response.code, b'Too many redirects',
+                                      location=url)
+
+        body = yield readBody(response)
+        headers = dict((key.decode('utf-8').lower(),
+                        values[-1].decode('utf-8', 'replace'))
+                       for key, values in response.headers.getAllRawHeaders())
+        return response.code, headers, body
+
+    def close(self):
+        return self.pool.closeCachedConnections()
@@ -0,0 +1,77 @@
+from .twisted_gears.admin import GearmanAdminProtocol
+from twisted.internet import defer, protocol, reactor, task
+from twisted.python import log
+
+
+class QueuePoller(object):
+    """Periodically asks every gearmand server for the status of our queues.
+
+    The queued, running and available worker counts are exported as gauges
+    and, if autoscaling is enabled, handed to the CurlerClient connected to
+    that server so it can resize its worker pool."""
+
+    def __init__(self, service, interval):
+        self.service = service
+        self.interval = interval
+        self.loop = task.LoopingCall(self.poll)
+
+    def start(self):
+        self.loop.start(self.interval)
+
+    def stop(self):
+        if self.loop.running:
+            self.loop.stop()
+
+    def poll(self):
+        return defer.DeferredList([self.poll_server(server)
+                                   for server in self.service.gearmand_servers])
+
+    @defer.inlineCallbacks
+    def get_status(self, server):
+        """Get the status of every queue on a server over the admin
+        protocol."""
+        host, port = server.split(':')
+        creator = protocol.ClientCreator(reactor, GearmanAdminProtocol)
+        proto = yield creator.connectTCP(host, int(port),
+                                         timeout=self.interval)
+        # don't let a stuck server hold up the next poll
+        timeout = reactor.callLater(self.interval,
+                                    proto.transport.loseConnection)
+        try:
+            status = yield proto.status()
+        finally:
+            if timeout.active():
+                timeout.cancel()
+            proto.transport.loseConnection()
+        return status
+
+    @defer.inlineCallbacks
+    def poll_server(self, server):
+        try:
+            status = yield self.get_status(server)
+        except Exception as e:
+            log.msg('ERROR: Failed to get queue status from %s: %r'
+                    % (server, e))
+            return
+
+        total_queued = total_running = total_workers = 0
+        for queue in self.service.job_queues:
+            queued, running, workers = status.get(queue, (0, 0, 0))
+            log.verbose('Queue status for %s on %s: queued=%d, running=%d, '
+                        'workers=%d'
+                        % (queue, server, queued, running, workers))
+
+            prefix = 'queue.%s.%s' % (server, queue)
+            self.service.stats.gauge('%s.queued' % prefix, queued)
+            self.service.stats.gauge('%s.running' % prefix, running)
+            self.service.stats.gauge('%s.workers' % prefix, workers)
+
+            total_queued += queued
+            total_running += running
+            total_workers = max(total_workers, workers)
+
+        client = self.service.clients.get(server)
+        if client is not None:
+            self.service.stats.gauge('workers.%s' % server, client.num_workers)
+            if self.service.autoscale:
+                client.autoscale(total_queued, total_running, total_workers)
@@ -0,0 +1,87 @@
+import cProfile
+import os
+import pstats
+import signal
+from time import time
+from twisted.internet import reactor
+from twisted.python import log
+
+# (category, substrings of 'filename:function') in the order they're checked
+CATEGORIES = [
+    ('gearman', ['twisted_gears/']),
+    ('json', ['/json/', '_json']),
+    ('http client', ['twisted/web/']),
+    ('logging', ['twisted/python/log', 'twisted/logger/']),
+    ('curler', ['curler/']),
+    ('twisted', ['twisted/']),
+]
+
+
+def categorize(filename, function):
+    name = '%s:%s' % (filename, function)
+    for category, patterns in CATEGORIES:
+        for pattern in patterns:
+            if pattern in name:
+                return category
+    return 'other'
+
+
+class Profiler(object):
+    """Runs cProfile on the reactor thread for a while when asked to.
+
+    Send the process SIGUSR2 to start. After `duration` seconds the stats
+    are dumped to a pstats file in `output_dir` and a breakdown of where
+    the time went is logged. Only one profile runs at a time."""
+
+    def __init__(self, duration, output_dir):
+        self.duration = duration
+        self.output_dir = output_dir
+        self.profile = None
+        self.stop_call = None
+
+    def install(self):
+        signal.signal(signal.SIGUSR2, self._signal)
+
+    def _signal(self, signum, frame):
+        reactor.callFromThread(self.start)
+
+    def start(self):
+        if self.profile is not None:
+            log.msg('Profiler is already running')
+            return
+
+        log.msg('Profiling for %ds' % self.duration)
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        self.stop_call = reactor.callLater(self.duration, self.stop)
+
+    def stop(self):
+        if self.stop_call.active():
+            self.stop_call.cancel()
+        self.profile.disable()
+        profile, self.profile = self.profile, None
+
+        path = os.path.join(self.output_dir, 'curler-%d-%d.pstats'
+                            % (os.getpid(), time()))
+        profile.dump_stats(path)
+        log.msg('Profile written to %s' % path)
+        self.log_breakdown(pstats.Stats(profile))
+
+    def log_breakdown(self, stats, top=15):
+        totals = {}
+        functions = []
+        for (filename, lineno, function), (cc, nc, tt, ct, callers) \
+                in stats.stats.items():
+            category = categorize(filename, function)
+            totals[category] = totals.get(category, 0) + tt
+            functions.append((tt, nc, category,
+                              '%s:%d(%s)' % (filename, lineno, function)))
+
+        total = sum(totals.values()) or 1
+        log.msg('Profile breakdown by internal time:')
+        for category, tt in sorted(totals.items(), key=lambda x: -x[1]):
+            log.msg('  %-12s %8.3fs %5.1f%%' % (category, tt, tt * 100 / total))
+
+        log.msg('Top %d functions by internal time:' % top)
+        for tt, nc, category, name in sorted(functions, reverse=True)[:top]:
+            log.msg('  %8.3fs %8d calls  [%s] %s' % (tt, nc, category, name))
@@ -0,0 +1,113 @@
+import math
+import random
+from collections import deque
+from twisted.internet import defer, reactor
+
+
+def parse_limits(value):
+    """Parse 'name=rate[:burst],...' into a dict of name -> (rate, burst).
+
+    Raises ValueError unless the rate is above 0 and the burst is at least
+    1, since a bucket couldn't hand out a whole token otherwise."""
+    limits = {}
+    if not value:
+        return limits
+    for item in value.split(','):
+        name, limit = item.rsplit('=', 1)
+        if ':' in limit:
+            rate, burst = limit.split(':', 1)
+            rate, burst = float(rate), float(burst)
+            if not (burst >= 1 and math.isfinite(burst)):
+                raise ValueError('burst for %s must be at least 1' % name)
+        else:
+            rate, burst = float(limit), None
+        if not (rate > 0 and math.isfinite(rate)):
+            raise ValueError('rate for %s must be above 0' % name)
+        limits[name] = (rate, burst)
+    return limits
+
+
+class TokenBucket(object):
+    """Allows `rate` acquisitions per second with bursts of up to `burst`.
+
+    Callers which can't get a token right away are queued and released in
+    the order they arrived as tokens become available."""
+
+    def __init__(self, rate, burst=None, clock=reactor):
+        self.rate = float(rate)
+        self.burst = float(burst or max(self.rate, 1))
+        self.tokens = self.burst
+        self.clock = clock
+        self.updated = clock.seconds()
+        self.waiting = deque()
+        self.call = None
+
+    def _refill(self):
+        now = self.clock.seconds()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds a new caller would have to wait for a token."""
+        self._refill()
+        needed = len(self.waiting) + 1 - self.tokens
+        return max(needed / self.rate, 0)
+
+    def acquire(self):
+        """Take a token. Returns a deferred which fires once we have one."""
+        d = defer.Deferred()
+        self.waiting.append(d)
+        if self.call is None:
+            self._release()
+        return d
+
+    def _release(self):
+        self.call = None
+        self._refill()
+        while self.waiting and self.tokens >= 1:
+            self.tokens -= 1
+            self.waiting.popleft().callback(None)
+        if self.waiting:
+            self.call = self.clock.callLater((1 - self.tokens) / self.rate,
+                                             self._release)
+
+
+class RateLimiter(object):
+    """Token bucket limits keyed by job method and by backend base URL."""
+
+    def __init__(self, method_limits=None, backend_limits=None,
+                 clock=reactor):
+        self.clock = clock
+        self.methods = dict((name, TokenBucket(rate, burst, clock))
+                            for name, (rate, burst)
+                            in (method_limits or {}).items())
+        self.backends = dict((name, TokenBucket(rate, burst, clock))
+                             for name, (rate, burst)
+                             in (backend_limits or {}).items())
+
+    def choose_base_url(self, base_urls):
+        """Pick a random base URL, preferring ones with the shortest wait."""
+        if not self.backends:
+            return random.choice(base_urls)
+
+        delays = [(self.backends[url].delay() if url in self.backends else 0,
+                   url) for url in base_urls]
+        shortest = min(delays)[0]
+        return random.choice([url for delay, url in delays
+                              if delay == shortest])
+
+    @defer.inlineCallbacks
+    def wait(self, method, base_url):
+        """Wait until the method and backend allow another request.
+
+        Fires with the number of seconds spent waiting."""
+        if method not in self.methods and base_url not in self.backends:
+            return 0
+
+        started = self.clock.seconds()
+        if method in self.methods:
+            yield self.methods[method].acquire()
+        if base_url in self.backends:
+            yield self.backends[base_url].acquire()
+        return self.clock.seconds() - started
@@ -0,0 +1,47 @@
+import json
+import random
+from twisted.python import log
+
+
+class JobRecorder(object):
+    """Writes a sample of the jobs we do to a JSON-lines file.
+
+    Each line has the job's queue, raw data, method, start time, time taken
+    in ms, status and backend response size. The file can be fed to
+    curler.replay to reproduce the same traffic against a test gearmand."""
+
+    def __init__(self, path, sample_rate=1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.file = None
+
+    def open(self):
+        self.file = open(self.path, 'a')
+
+    def close(self):
+        self.file.close()
+
+    def sample(self):
+        """Decide whether the next job should be recorded."""
+        return random.random() < self.sample_rate
+
+    def record(self, job, started, time_taken, response):
+        try:
+            method = json.loads(job.data).get('method')
+        except (ValueError, AttributeError):
+            method = None
+
+        try:
+            line = json.dumps({'queue': job.function.decode('utf-8'),
+                               'data': job.data.decode('utf-8'),
+                               'method': method,
+                               'time': round(started, 3),
+                               'ms': time_taken,
+                               'status': response.get('status'),
+                               'size': len(response.get('response') or '')},
+                              sort_keys=True)
+        except UnicodeDecodeError:
+            log.msg('ERROR: Not recording job %s, data is not UTF-8'
+                    % job.handle.decode('utf-8', 'replace'))
+            return
+        self.file.write(line + '\n')
@@ -0,0 +1,103 @@
+"""
+Replays jobs recorded with curler's --record-file into a gearmand.
+
+    $ python -m curler.replay --file jobs.jsonl --speed 10
+
+Jobs are submitted as background jobs with the same spacing they were
+recorded with, divided by --speed. Use --speed 0 to submit as fast as
+gearmand will take them.
+"""
+
+import json
+import sys
+from time import time
+from twisted.internet import defer, protocol, reactor, task
+from twisted.python import log, usage
+from curler.twisted_gears import client
+
+
+class Options(usage.Options):
+    optParameters = [
+        ["file", "f", None, "Recorded jobs file."],
+        ["gearmand-server", "g", "localhost:4730",
+          "Gearman job server to submit jobs to."],
+        ["job-queue", "q", None,
+          "Submit every job to this queue instead of the recorded one."],
+        ["speed", "s", 1.0,
+          "Replay speed multiplier (0 for as fast as possible)."],
+        ["window", "w", 100,
+          "Max submitted jobs waiting for JOB_CREATED."]]
+
+    def postOptions(self):
+        if not self['file']:
+            raise usage.UsageError("--file is required")
+
+
+def read_jobs(path):
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
+
+
+@defer.inlineCallbacks
+def replay(gearman, jobs, speed, window, job_queue=None):
+    """Submit recorded jobs, keeping their relative timing scaled by speed.
+
+    Fires with the number of jobs submitted."""
+    semaphore = defer.DeferredSemaphore(window)
+    submitted = []
+    first = None
+    started = time()
+
+    for job in jobs:
+        if speed:
+            if first is None:
+                first = job['time']
+            delay = started + (job['time'] - first) / speed - time()
+            if delay > 0:
+                yield task.deferLater(reactor, delay, lambda: None)
+
+        yield semaphore.acquire()
+        d = gearman.submitBackground(job_queue or job['queue'],
+                                     job['data'].encode('utf-8'))
+        d.addBoth(lambda x: semaphore.release() or x)
+        submitted.append(d)
+
+    yield defer.DeferredList(submitted, consumeErrors=True)
+    return len(submitted)
+
+
+@defer.inlineCallbacks
+def run(options):
+    host, port = options['gearmand-server'].split(':')
+    creator = protocol.ClientCreator(reactor, client.GearmanProtocol)
+    proto = yield creator.connectTCP(host, int(port))
+    gearman = client.GearmanClient(proto)
+
+    started = time()
+    count = yield replay(gearman, read_jobs(options['file']),
+                         float(options['speed']), int(options['window']),
+                         options['job-queue'])
+    elapsed = time() - started
+    log.msg('Submitted %d jobs in %.2fs (%.1f jobs/s)'
+            % (count, elapsed, count / max(elapsed, 0.001)))
+    proto.transport.loseConnection()
+
+
+def main(argv=None):
+    options = Options()
+    try:
+        options.parseOptions(argv)
+    except usage.UsageError as e:
+        print('%s\n%s' % (options, e))
+        sys.exit(1)
+
+    log.startLogging(sys.stdout)
+    d = run(options)
+    d.addErrback(log.err)
+    d.addBoth(lambda x: reactor.stop())
+    reactor.run()
+
+
+if __name__ == '__main__':
+    main()
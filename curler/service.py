@@ -1,18 +1,29 @@
 import json
-import random
+import math
+import signal
 import traceback
-import urllib
-from twisted_gears import client
+from urllib.parse import urlencode
+from .bulkhead import Bulkhead
+from .compression import gzip
+from .httpclient import HTTPBackend
+from .poller import QueuePoller
+from .profiler import Profiler
+from .ratelimit import RateLimiter
+from .recorder import JobRecorder
+from .spool import ResultSpool
+from .stats import Stats
+from .twisted_gears import client, constants
+from .unixsocket import UnixSocketBackend, is_unix_url, parse_unix_url
+from .wsgi import WSGIDispatcher
 from time import time
 from twisted.application.service import Service
 from twisted.internet import defer, protocol, reactor, task
 from twisted.python import log
-from twisted.web.client import getPage, HTTPClientFactory
-from twisted.web.error import Error
 
-# we don't want to hear about each web request we make
-HTTPClientFactory.noisy = False
 
+# backends can ask for follow-up jobs with this header or content type
+SUBMIT_HEADER = 'x-curler-submit'
+ENVELOPE_TYPE = 'application/vnd.curler+json'
 
 # By default, verbose logging is disabled. This function is redefined
 # when the service starts if verbose logging is enabled.
@@ -21,123 +32,451 @@ log.verbose = lambda x: None
 
 class CurlerClient(client.GearmanProtocol):
 
-    def __init__(self, service, server, base_urls, job_queue, num_workers):
+    def __init__(self, service, server, base_urls, job_queues, num_workers):
         self.service = service
         self.server = server
         self.base_urls = base_urls
-        self.job_queue = job_queue
+        self.job_queues = job_queues
         self.num_workers = num_workers
+        self.running_workers = 0
+        self.borrowed_workers = 0
+        self.busy_workers = 0
+        self.requests = set()
+        self.draining = False
+        self.abandoned = False
+        self.bulkhead = Bulkhead(service.method_concurrency,
+                                 service.method_queue_size)
 
     def connectionLost(self, reason):
         log.msg('CurlerClient lost connection to %s: %s'
                 % (self.server, reason))
+        if self.service.clients.get(self.server) is self:
+            del self.service.clients[self.server]
         client.GearmanProtocol.connectionLost(self, reason)
 
     def connectionMade(self):
         log.msg('CurlerClient made connection to %s' % self.server)
+        self.service.clients[self.server] = self
         self.start_work()
 
     def start_work(self):
-        worker = client.GearmanWorker(self)
-        worker.registerFunction(self.job_queue, self.handle_job)
-
-        log.msg('Firing up %d workers...' % self.num_workers)
-        coop = task.Cooperator()
-        for i in range(self.num_workers):
-            reactor.callLater(0.1 * i, lambda: coop.coiterate(worker.doJobs()))
+        self.worker = client.GearmanWorker(self, self.service.noop_wake_all)
+        if self.service.spool:
+            self.worker.undeliverable = self._spool_result
+        self.gearman_client = client.GearmanClient(self)
+        for queue in self.job_queues:
+            self.worker.registerFunction(queue, self.handle_job)
+        self.coop = task.Cooperator()
+        self.set_num_workers(self.num_workers)
+
+    def reconfigure(self, base_urls, job_queues, num_workers):
+        """Apply new settings without dropping the connection."""
+        self.base_urls = base_urls
+        for queue in job_queues:
+            if queue not in self.job_queues:
+                self.worker.registerFunction(queue, self.handle_job)
+        for queue in self.job_queues:
+            if queue not in job_queues:
+                self.worker.unregisterFunction(queue)
+        self.job_queues = job_queues
+        self.set_num_workers(num_workers)
+
+    def set_num_workers(self, num_workers):
+        """Change the number of jobs this connection works on in parallel.
+
+        New workers are started right away. Surplus workers stop after
+        finishing their current job so nothing in flight is interrupted."""
+        self.num_workers = num_workers
+        to_start = self._wanted_workers() - self.running_workers
+        if to_start <= 0:
+            return
+
+        log.msg('Firing up %d workers...' % to_start)
+        for i in range(to_start):
+            self.running_workers += 1
+            reactor.callLater(0.1 * i, self._run_worker)
+
+    def borrow_worker(self):
+        """Start an extra worker while a job waits on its method's bulkhead.
+
+        The waiting job keeps its own worker busy, so without this a slow
+        method would eat into the pool available to every other method."""
+        self.borrowed_workers += 1
+        self._top_up_workers()
+
+    def return_worker(self):
+        self.borrowed_workers -= 1
+        # the job left its method's wait queue, so there may be room to
+        # take jobs again
+        self._top_up_workers()
+
+    def _top_up_workers(self):
+        while self.running_workers < self._wanted_workers():
+            self.running_workers += 1
+            self._run_worker()
+
+    def _wanted_workers(self):
+        # with a method's wait queue full, jobs are left in gearmand until
+        # it has room instead of piling up here
+        if self.draining or self.bulkhead.full():
+            return 0
+        return self.num_workers + self.borrowed_workers
+
+    def stop_work(self):
+        """Stop taking new jobs but let the ones in flight finish."""
+        self.draining = True
+        self.worker.resetAbilities()
+
+    def is_idle(self):
+        """Whether no jobs are in flight or on their way to us."""
+        return self.busy_workers == 0 and not self.deferreds
+
+    def abandon_jobs(self):
+        """Give up on the jobs in flight once we've disconnected.
+
+        gearmand hands them out again, so nothing they return is kept."""
+        self.abandoned = True
+        for request in list(self.requests):
+            request.cancel()
+
+    def _run_worker(self):
+        self.coop.coiterate(self.worker.doJobs(self._keep_working))
+
+    def _keep_working(self):
+        if self.running_workers > self._wanted_workers():
+            self.running_workers -= 1
+            return False
+        return True
+
+    def autoscale(self, queued, running, workers):
+        """Size our worker pool using the queue status reported by gearmand.
+
+        Waiting jobs are split evenly between every worker connection which
+        can do them, and the pool is kept between --num-workers and
+        --max-workers."""
+        waiting = max(queued - running, 0)
+        share = int(math.ceil(float(waiting) / max(workers, 1)))
+        target = max(self.busy_workers + share, self.service.num_workers)
+        target = min(target, self.service.max_workers)
+        if target != self.num_workers:
+            log.msg('Scaling workers for %s from %d to %d (queued=%d, '
+                    'running=%d, workers=%d)'
+                    % (self.server, self.num_workers, target, queued,
+                       running, workers))
+            self.set_num_workers(target)
+
+    def _spool_result(self, cmd, job, data):
+        # failures and abandoned jobs aren't worth keeping since gearmand
+        # will retry the job
+        if cmd != constants.WORK_COMPLETE or self.abandoned:
+            return
+
+        # gearmand gives the job to a worker again, see handle_job
+        log.msg('Lost connection to %s before job %s finished, spooling '
+                'result' % (self.server, job.handle.decode('utf-8')))
+        self.service.spool.append(self.server, job, data)
+        self.service.stats.incr('spool.written')
 
     @defer.inlineCallbacks
     def handle_job(self, job):
         time_start = time()
+        handle = job.handle.decode('utf-8')
+
+        # we did this one before the connection dropped, so just send the
+        # result this time
+        if self.service.spool:
+            spooled = self.service.spool.pop(self.server, job)
+            if spooled is not None:
+                log.msg('Sending spooled result for job: %s' % handle)
+                self.service.stats.incr('spool.sent')
+                return spooled
+
+        recorder = self.service.recorder
+        record = recorder is not None and recorder.sample()
+        self.busy_workers += 1
         try:
-            log.msg('Got job: %s' % job.handle)
+            log.msg('Got job: %s' % handle)
             log.verbose('data=%r' % job.data)
-            response = yield self._make_request(job.handle, job.data)
-        except Exception, e:
+            request = self._make_request(handle, job.data)
+            self.requests.add(request)
+            try:
+                response = yield request
+            finally:
+                self.requests.discard(request)
+        except defer.CancelledError:
+            response = {"error": "Job abandoned while stopping"}
+        except Exception as e:
             log.msg('ERROR: Unhandled exception: %r' % e)
             # Log full traceback on multiple lines
             for line in traceback.format_exc().split('\n'):
                 log.msg(line)
             response = {"error": "Internal curler error. Check the logs."}
+        self.busy_workers -= 1
 
         # always include handle in response
-        response['job_handle'] = job.handle
+        response['job_handle'] = handle
 
         # log error if we're returning one
         if 'error' in response:
             log.msg('ERROR: %s' % response['error'])
-            response['job_data'] = job.data
+            response['job_data'] = job.data.decode('utf-8', 'replace')
 
         # format response nicely
-        response_json = json.dumps(response, sort_keys=True, indent=2)
+        response_json = json.dumps(response, sort_keys=True,
+                                   indent=2).encode('utf-8')
+
+        # big results sit in gearmand's memory until the client reads them
+        threshold = self.service.compress_results
+        if threshold and len(response_json) > threshold:
+            compressed = gzip(response_json)
+            self.service.stats.incr('results.compressed')
+            self.service.stats.incr('results.bytes_saved',
+                                    len(response_json) - len(compressed))
+            response_json = compressed
 
         time_taken = int((time() - time_start) * 1000 + 0.5)
-        log.msg('Completed job: %s, method=%s, time=%sms, status=%d'
-                % (job.handle, response['url'], time_taken,
+        self.service.stats.timing('jobs', time_taken)
+        if record:
+            recorder.record(job, time_start, time_taken, response)
+        log.msg('Completed job: %s, method=%s, time=%sms, status=%s'
+                % (handle, response.get('url'), time_taken,
                    response.get('status')))
-        defer.returnValue(response_json)
+        return response_json
 
     @defer.inlineCallbacks
     def _make_request(self, handle, data):
         # make sure job arg is valid json
         try:
-            job_data = json.loads(data, encoding='UTF-8')
-        except ValueError, e:
-            defer.returnValue({"error": "Job data is not valid JSON"})
+            job_data = json.loads(data)
+        except ValueError:
+            return {"error": "Job data is not valid JSON"}
 
         # make sure it contains a method
         if 'method' not in job_data:
-            defer.returnValue({"error":
-                               "Missing \"method\" property in job data"})
+            return {"error": "Missing \"method\" property in job data"}
 
         # make sure it contains data
         if 'data' not in job_data:
-            defer.returnValue({"error":
-                               "Missing \"data\" property in job data"})
+            return {"error": "Missing \"data\" property in job data"}
+
+        # make sure its timestamps are numbers
+        try:
+            deadline = self.get_deadline(job_data)
+        except (TypeError, ValueError):
+            return {"error": "\"deadline\" and \"enqueued_at\" must be "
+                             "Unix timestamps"}
+
+        # don't bother with jobs nobody is waiting for anymore
+        if deadline is not None and deadline <= time():
+            return self._expired(deadline)
+
+        # wait for our turn if the method is at its concurrency limit
+        method = job_data['method']
+        slot = self.bulkhead.acquire(method, self.num_workers)
+        if not slot.called:
+            # let another worker take jobs for other methods while we wait
+            self.borrow_worker()
+            self._bulkhead_stats(method)
+            yield slot
+            self.return_worker()
+
+        self._bulkhead_stats(method)
+        try:
+            response = yield self._post_job(handle, job_data, deadline)
+        finally:
+            self.bulkhead.release(method)
+            self._bulkhead_stats(method)
+        return response
+
+    def _bulkhead_stats(self, method):
+        prefix = 'bulkhead.%s.%s' % (self.server, method)
+        self.service.stats.gauge('%s.running' % prefix,
+                                 self.bulkhead.running.get(method, 0))
+        self.service.stats.gauge('%s.waiting' % prefix,
+                                 len(self.bulkhead.waiting.get(method, ())))
+
+    def get_deadline(self, job_data):
+        """Get the time after which the job's result is no longer wanted.
+
+        Jobs can include a 'deadline' timestamp, or an 'enqueued_at'
+        timestamp which is combined with --max-job-age. Raises ValueError
+        or TypeError if the timestamp isn't a finite number."""
+        max_job_age = self.service.max_job_age
+        if job_data.get('deadline') is not None:
+            deadline = float(job_data['deadline'])
+        elif job_data.get('enqueued_at') is not None and max_job_age:
+            deadline = float(job_data['enqueued_at']) + max_job_age
+        else:
+            return None
+        # float() takes "nan" and "inf", which would never expire
+        if not math.isfinite(deadline):
+            raise ValueError('deadline is not finite: %r' % deadline)
+        return deadline
+
+    def _expired(self, deadline):
+        self.service.stats.incr('jobs.expired')
+        return {"error": "Job deadline passed %.3fs ago"
+                         % (time() - deadline),
+                "expired": True}
 
+    @defer.inlineCallbacks
+    def _post_job(self, handle, job_data, deadline=None):
         headers = self.build_headers(job_data)
 
         # we'll post the data as JSON, so convert it back
         data = json.dumps(job_data['data'])
 
-        # select random base URL to hit
-        path = random.choice(self.base_urls)
-        url = str("%s/%s" % (path, job_data['method']))
+        # select random base URL to hit, avoiding throttled ones if we can
+        method = job_data['method']
+        path = self.service.rate_limiter.choose_base_url(self.base_urls)
+        url = "%s/%s" % (path, method)
+
+        # hold the job until its method and backend are under their limits
+        waited = yield self.service.rate_limiter.wait(method, path)
+        if waited:
+            waited_ms = int(waited * 1000 + 0.5)
+            log.verbose('Throttled %s for %dms' % (url, waited_ms))
+            self.service.stats.timing('throttled', waited_ms)
+            self.service.stats.timing('throttled.method.%s' % method,
+                                      waited_ms)
+            self.service.stats.timing('throttled.backend.%s' % path,
+                                      waited_ms)
+
+        # tell the backend how long it has and give up when time runs out
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time()
+            if timeout <= 0:
+                return self._expired(deadline)
+            headers['X-Curler-Time-Remaining'] = '%.3f' % timeout
 
         try:
             log.verbose('POSTing to %s, data=%r' % (url, data))
-            postdata = urllib.urlencode({
+            postdata = urlencode({
                 "job_handle": handle,
-                "data": data})
+                "data": data}).encode('ascii')
 
-            try:
-                # despite our name, we're not actually using curl :)
-                response = yield getPage(url, method='POST', postdata=postdata,
-                                         headers=headers)
-                status = 200
-            except Error, e:
-                status = int(e.status)
-                response = e.response
+            status, response_headers, response = yield self._post(
+                url, postdata, headers, timeout)
             log.verbose('POST complete: status=%d, response=%r'
                              % (status, response))
-            defer.returnValue({'url': url,
-                               'status': status,
-                               'response': response})
-        except Exception, e:
-            defer.returnValue({"error": "POST failed: %r - %s" % (e, e)})
+            response, submits = self.get_submits(
+                response_headers, response.decode('utf-8', 'replace'))
+            rv = {'url': url,
+                  'status': status,
+                  'response': response}
+            # a failed request shouldn't fan out more work
+            if submits and 200 <= status < 300:
+                rv['submitted'] = yield self.submit_jobs(submits)
+            elif submits:
+                log.msg('ERROR: Ignoring %d follow-up jobs from %s, status=%d'
+                        % (len(submits), url, status))
+                self.service.stats.incr('submit.ignored', len(submits))
+            return rv
+        except Exception as e:
+            if deadline is not None and deadline <= time():
+                return self._expired(deadline)
+            return {"error": "POST failed: %r - %s" % (e, e)}
+
+    def _post(self, url, postdata, headers, timeout=None):
+        """POST to the backend. Fires with (status, headers, response body).
+
+        The WSGI application can't be interrupted, so the timeout only
+        applies to HTTP backends."""
+        if self.service.wsgi:
+            return self.service.wsgi.post(url, postdata, headers)
+
+        # despite our name, we're not actually using curl :)
+        if is_unix_url(url):
+            socket_path, url = parse_unix_url(url)
+            backend = self.service.get_unix_backend(socket_path)
+        else:
+            backend = self.service.http_backend
+        return backend.post(url, postdata, headers, timeout)
+
+    def get_submits(self, headers, response):
+        """Pull the follow-up jobs a backend asked for out of its response.
+
+        They can be listed in an X-Curler-Submit header, or the response
+        can be a JSON envelope like {"response": ..., "submit": [...]} sent
+        as application/vnd.curler+json. Returns the response to put in the
+        job result and the list of jobs."""
+        submits = []
+        try:
+            if SUBMIT_HEADER in headers:
+                submits.extend(self._submit_list(
+                    json.loads(headers[SUBMIT_HEADER])))
+            content_type = headers.get('content-type', '').split(';')[0]
+            if content_type.strip() == ENVELOPE_TYPE:
+                envelope = json.loads(response)
+                submits.extend(self._submit_list(envelope.get('submit', [])))
+                response = envelope.get('response', '')
+                if not isinstance(response, str):
+                    response = json.dumps(response)
+        except (ValueError, AttributeError) as e:
+            log.msg('ERROR: Bad follow-up jobs from backend: %s' % e)
+            self.service.stats.incr('submit.invalid')
+        return response, submits
+
+    @staticmethod
+    def _submit_list(value):
+        if not isinstance(value, list):
+            raise ValueError('expected a list of jobs, got %r' % (value,))
+        return value
+
+    @defer.inlineCallbacks
+    def submit_jobs(self, jobs):
+        """Submit follow-up jobs as background jobs on our own connection.
+
+        Each job is an object with a `queue` and `data`, and optionally a
+        `unique` id and a `priority` of high or low. Data which isn't a
+        string is sent as JSON. The SUBMIT_JOB_BGs go out back to back
+        without waiting for each JOB_CREATED. Fires with the number of jobs
+        gearmand accepted."""
+        if not self.connected:
+            log.msg('ERROR: Lost connection to %s, dropping %d follow-up '
+                    'jobs' % (self.server, len(jobs)))
+            self.service.stats.incr('submit.failed', len(jobs))
+            return 0
+
+        submitters = {'high': self.gearman_client.submitBackgroundHigh,
+                      'low': self.gearman_client.submitBackgroundLow}
+        submitted = []
+        for job in jobs:
+            if not (isinstance(job, dict) and isinstance(job.get('queue'), str)
+                    and 'data' in job):
+                log.msg('ERROR: Ignoring follow-up job without a queue and '
+                        'data: %r' % (job,))
+                self.service.stats.incr('submit.invalid')
+                continue
+
+            data = job['data']
+            if not isinstance(data, str):
+                data = json.dumps(data)
+            unique = job.get('unique')
+            if unique is None:
+                unique = ''
+            submit = submitters.get(job.get('priority'),
+                                    self.gearman_client.submitBackground)
+            submitted.append(submit(job['queue'], data, str(unique)))
+
+        results = yield defer.DeferredList(submitted, consumeErrors=True)
+        # gearmand answers with ERROR rather than JOB_CREATED on failure
+        created = len([ok for ok, rv in results
+                       if ok and rv[0] == constants.JOB_CREATED])
+        self.service.stats.incr('submit.jobs', created)
+        if created < len(results):
+            log.msg('ERROR: Failed to submit %d follow-up jobs to %s'
+                    % (len(results) - created, self.server))
+            self.service.stats.incr('submit.failed', len(results) - created)
+        return created
 
     @staticmethod
     def build_headers(job_data):
         # default headers - can be overridden by job_data['headers']
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
         if 'headers' in job_data:
-            # headers can't be unicode but json.loads makes all the string unicode
-            for key, value in job_data['headers'].iteritems():
-                if isinstance(key, unicode):
-                    key = key.encode('utf-8')
-                if isinstance(value, unicode):
-                    value = value.encode('utf-8')
-                headers[key] = value
+            headers.update(job_data['headers'])
 
         return headers
 
@@ -151,46 +490,269 @@ class CurlerClientFactory(protocol.ReconnectingClientFactory):
     maxDelay = 5
     maxRetries = 120
 
-    def __init__(self, service, server, base_urls, job_queue, num_workers):
+    def __init__(self, service, server, base_urls, job_queues, num_workers):
         self.service = service
         self.server = server
         self.base_urls = base_urls
-        self.job_queue = job_queue
+        self.job_queues = job_queues
         self.num_workers = num_workers
 
     def buildProtocol(self, addr):
         p = self.protocol(self.service, self.server, self.base_urls,
-                          self.job_queue, self.num_workers)
+                          self.job_queues, self.num_workers)
         p.factory = self
         return p
 
 
 class CurlerService(Service):
 
-    def __init__(self, base_urls, gearmand_servers, job_queue, num_workers,
-                 verbose=False):
+    def __init__(self, base_urls, gearmand_servers, job_queues, num_workers,
+                 verbose=False, stats_interval=60, status_interval=0,
+                 max_workers=0, method_limits=None, backend_limits=None,
+                 method_concurrency=None, method_queue_size=10,
+                 wsgi_app=None, noop_wake_all=False, max_job_age=0,
+                 spool_file=None, record_file=None, record_sample_rate=1.0,
+                 profile_seconds=30, profile_dir=None, config_file=None,
+                 drain_timeout=30, accept_gzip=False, compress_results=0):
         self.base_urls = base_urls
         self.gearmand_servers = gearmand_servers
-        self.job_queue = job_queue
+        self.job_queues = job_queues
         self.num_workers = num_workers
+        self.max_workers = max_workers
+        self.autoscale = max_workers > num_workers
+        self.config_file = config_file
+        self.drain_timeout = drain_timeout
+        self.accept_gzip = accept_gzip
+        self.compress_results = compress_results
+        self.factories = {}
+        self.clients = {}
+        self.draining = False
+        self.rate_limiter = RateLimiter(method_limits, backend_limits)
+        self.method_concurrency = method_concurrency or {}
+        self.method_queue_size = method_queue_size
+        self.noop_wake_all = noop_wake_all
+        self.max_job_age = max_job_age
+        self.spool = ResultSpool(spool_file) if spool_file else None
+        self.profiler = None
+        if profile_dir:
+            self.profiler = Profiler(profile_seconds, profile_dir)
+
+        self.recorder = None
+        if record_file:
+            self.recorder = JobRecorder(record_file, record_sample_rate)
+
+        self.stats = Stats()
+        self.stats_loop = None
+        if stats_interval:
+            self.stats_loop = task.LoopingCall(self.report_stats)
+        self.stats_interval = stats_interval
+
+        self.http_backend = HTTPBackend(self.max_connections(), accept_gzip)
+        self.unix_backends = {}
+        self.wsgi = None
+        if wsgi_app:
+            # every connection's workers share the pool
+            self.wsgi = WSGIDispatcher.from_name(wsgi_app,
+                                                 self.max_connections())
+
+        self.poller = None
+        if status_interval:
+            self.poller = QueuePoller(self, status_interval)
 
         # define verbose logging function
         if verbose:
             log.verbose = lambda x: log.msg('VERBOSE: %s' % x)
 
-    @defer.inlineCallbacks
     def startService(self):
         Service.startService(self)
-        log.msg('Service starting. servers=%r, job queue=%s, base urls=%r'
-                % (self.gearmand_servers, self.job_queue, self.base_urls))
+        if self.config_file:
+            self.load_config()
+            signal.signal(signal.SIGHUP, self._sighup)
+
+        log.msg('Service starting. servers=%r, job queues=%r, base urls=%r'
+                % (self.gearmand_servers, self.job_queues, self.base_urls))
         log.verbose('Verbose logging is enabled')
 
+        if self.profiler:
+            self.profiler.install()
+
+        if self.spool:
+            self.spool.open()
+        if self.recorder:
+            log.msg('Recording %d%% of jobs to %s'
+                    % (self.recorder.sample_rate * 100, self.recorder.path))
+            self.recorder.open()
+
+        if self.wsgi:
+            log.msg('Calling WSGI application %r instead of POSTing'
+                    % self.wsgi.application)
+            self.wsgi.start()
+
         for server in self.gearmand_servers:
             host, port = server.split(':')
             f = CurlerClientFactory(self, server, self.base_urls,
-                                    self.job_queue, self.num_workers)
-            proto = yield reactor.connectTCP(host, int(port), f)
+                                    self.job_queues, self.num_workers)
+            self.factories[server] = f
+            reactor.connectTCP(host, int(port), f)
+
+        if self.stats_loop:
+            self.stats_loop.start(self.stats_interval, now=False)
+        if self.poller:
+            self.poller.start()
+
+    def _sighup(self, signum, frame):
+        reactor.callFromThread(self.reload)
+
+    def load_config(self):
+        """Read settings from the --config file.
+
+        It's a JSON object with any of the base-urls, job-queue, num-workers
+        and max-workers options. Lists can be given as JSON lists or as
+        comma-separated strings like on the command line."""
+        def _list(value):
+            if isinstance(value, str):
+                value = value.split(',')
+            return [str(x) for x in value]
+
+        # nothing is changed unless the whole file is good
+        try:
+            with open(self.config_file) as f:
+                config = json.load(f)
+            base_urls = _list(config.get('base-urls', self.base_urls))
+            job_queues = _list(config.get('job-queue', self.job_queues))
+            num_workers = int(config.get('num-workers', self.num_workers))
+            max_workers = int(config.get('max-workers', self.max_workers))
+            if not base_urls or not job_queues:
+                raise ValueError('base-urls and job-queue must not be empty')
+            if num_workers < 1:
+                raise ValueError('num-workers must be at least 1')
+        except (IOError, ValueError, TypeError, AttributeError) as e:
+            log.msg('ERROR: Failed to load config from %s: %s'
+                    % (self.config_file, e))
+            return False
 
+        self.base_urls = base_urls
+        self.job_queues = job_queues
+        self.num_workers = num_workers
+        self.max_workers = max_workers
+        self.autoscale = self.max_workers > self.num_workers
+        self.resize_pools()
+        return True
+
+    def resize_pools(self):
+        """Size the backend connection pools and WSGI threads for the
+        current worker counts."""
+        max_connections = self.max_connections()
+        self.http_backend.pool.maxPersistentPerHost = max_connections
+        for backend in self.unix_backends.values():
+            backend.pool.maxPersistentPerHost = max_connections
+        if self.wsgi:
+            self.wsgi.pool.adjustPoolsize(maxthreads=max_connections)
+
+    def reload(self):
+        """Reload the config file and apply it to every connection."""
+        if self.draining:
+            log.msg('Not reloading config while stopping')
+            return
+
+        log.msg('Reloading config from %s' % self.config_file)
+        if not self.load_config():
+            return
+
+        log.msg('New config: job queues=%r, base urls=%r, workers=%d'
+                % (self.job_queues, self.base_urls, self.num_workers))
+        for factory in self.factories.values():
+            factory.base_urls = self.base_urls
+            factory.job_queues = self.job_queues
+            factory.num_workers = self.num_workers
+        for curler_client in self.clients.values():
+            curler_client.reconfigure(self.base_urls, self.job_queues,
+                                      self.num_workers)
+
+    def report_stats(self):
+        for server, curler_client in self.clients.items():
+            counters = curler_client.worker.counters
+            prefix = 'gearman.%s' % server
+            for name, value in counters.items():
+                self.stats.gauge('%s.%s' % (prefix, name), value)
+            if counters['grab_job']:
+                self.stats.gauge('%s.no_job_ratio' % prefix,
+                                 round(float(counters['no_job'])
+                                       / counters['grab_job'], 3))
+        self.stats.report()
+
+    def max_connections(self):
+        # one for every worker on every gearmand connection
+        return (max(self.num_workers, self.max_workers)
+                * len(self.gearmand_servers))
+
+    def get_unix_backend(self, socket_path):
+        if socket_path not in self.unix_backends:
+            self.unix_backends[socket_path] = UnixSocketBackend(
+                socket_path, self.max_connections(), self.accept_gzip)
+        return self.unix_backends[socket_path]
+
+    @defer.inlineCallbacks
     def stopService(self):
         Service.stopService(self)
         log.msg('Service stopping')
+        if self.poller:
+            self.poller.stop()
+        # every job has finished or been abandoned by now, so nothing is
+        # left to spool
+        yield self.drain()
+
+        self.http_backend.close()
+        for backend in self.unix_backends.values():
+            backend.close()
+        if self.spool:
+            self.spool.close()
+        if self.recorder:
+            self.recorder.close()
+        if self.stats_loop and self.stats_loop.running:
+            self.stats_loop.stop()
+        if self.wsgi:
+            self.wsgi.stop()
+
+    @defer.inlineCallbacks
+    def drain(self):
+        """Let in-flight jobs finish for up to --drain-timeout seconds, then
+        disconnect from every server.
+
+        Jobs still running after that are abandoned once the connections
+        are gone, so their results can't reach gearmand as if they were
+        real ones."""
+        self.draining = True
+        for factory in self.factories.values():
+            factory.stopTrying()
+
+        clients = list(self.clients.values())
+        if self.drain_timeout:
+            for curler_client in clients:
+                curler_client.stop_work()
+
+            deadline = time() + self.drain_timeout
+            busy = [c for c in clients if not c.is_idle()]
+            if busy:
+                log.msg('Waiting up to %ds for in-flight jobs to finish'
+                        % self.drain_timeout)
+            while busy and time() < deadline:
+                yield task.deferLater(reactor, 0.1, lambda: None)
+                busy = [c for c in clients if not c.is_idle()]
+
+            if busy:
+                log.msg('ERROR: Gave up waiting for %d in-flight jobs'
+                        % sum(c.busy_workers for c in busy))
+            else:
+                log.msg('All in-flight jobs finished')
+
+        for curler_client in clients:
+            curler_client.transport.loseConnection()
+
+        # results of jobs which finish while the connection closes are
+        # still sent, or spooled once it's gone
+        busy = [c for c in clients if c.requests]
+        while [c for c in busy if c.connected]:
+            yield task.deferLater(reactor, 0.1, lambda: None)
+        for curler_client in busy:
+            curler_client.abandon_jobs()
@@ -0,0 +1,118 @@
+import base64
+import hashlib
+import json
+import os
+from time import time
+from twisted.internet import task
+from twisted.python import log
+
+
+class ResultSpool(object):
+    """Append-only file of job results which couldn't be sent to gearmand.
+
+    Each line is a JSON object with the server, job handle, function, a
+    digest of the job data, the time and the base64 encoded result. Writes
+    are flushed and fsynced in batches every `flush_interval` seconds rather
+    than once per result.
+
+    gearmand hands the job to a worker again, and if that's us the spooled
+    result is used instead of doing the job twice. Results for jobs which
+    went to some other worker are dropped after `max_age` seconds."""
+
+    def __init__(self, path, flush_interval=1.0, max_age=86400):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_age = max_age
+        self.entries = []
+        self.dirty = False
+        self.removed = False
+        self.flush_loop = task.LoopingCall(self.flush)
+
+    def open(self):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        self.entries.append(json.loads(line))
+                    except ValueError:
+                        # partial line from a crash mid-write
+                        log.msg('ERROR: Skipping bad line in spool %s: %r'
+                                % (self.path, line))
+            log.msg('Loaded %d spooled results from %s'
+                    % (len(self.entries), self.path))
+        self.file = open(self.path, 'a')
+        self.compact()
+        self.flush_loop.start(self.flush_interval, now=False)
+
+    def close(self):
+        if self.flush_loop.running:
+            self.flush_loop.stop()
+        self.flush()
+        self.file.close()
+
+    def append(self, server, job, data):
+        entry = {'server': server,
+                 'handle': job.handle.decode('ascii'),
+                 'function': job.function.decode('utf-8', 'replace'),
+                 'digest': _digest(job.data),
+                 'time': round(time(), 3),
+                 'data': base64.b64encode(data).decode('ascii')}
+        self.entries.append(entry)
+        self.file.write(json.dumps(entry) + '\n')
+        self.dirty = True
+
+    def flush(self):
+        if self.removed:
+            self.compact()
+        elif self.dirty:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.dirty = False
+
+    def pending(self, server):
+        """Get (handle, data) for every result spooled for a server."""
+        return [(e['handle'].encode('ascii'), base64.b64decode(e['data']))
+                for e in self.entries if e['server'] == server]
+
+    def pop(self, server, job):
+        """Get and remove the result spooled for a job, or None.
+
+        gearmand starts numbering handles from scratch when it restarts, so
+        a result for the same handle but a different function or data is
+        for some other job. It's dropped since its job won't come back."""
+        handle = job.handle.decode('ascii')
+        for i, e in enumerate(self.entries):
+            if (e['server'], e['handle']) == (server, handle):
+                del self.entries[i]
+                self.removed = True
+                if (e.get('function') ==
+                        job.function.decode('utf-8', 'replace')
+                        and e.get('digest') == _digest(job.data)):
+                    return base64.b64decode(e['data'])
+                log.msg('Dropping spooled result for job %s on %s, the '
+                        'handle now belongs to another job' % (handle, server))
+                return None
+        return None
+
+    def compact(self):
+        """Rewrite the spool with only the entries still pending.
+
+        Entries older than max_age are dropped."""
+        oldest = time() - self.max_age
+        self.entries = [e for e in self.entries
+                        if e.get('time', oldest) >= oldest]
+        tmp_path = '%s.tmp' % self.path
+        with open(tmp_path, 'w') as f:
+            for entry in self.entries:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.file.close()
+        os.rename(tmp_path, self.path)
+        self.file = open(self.path, 'a')
+        self.dirty = False
+        self.removed = False
+
+
+def _digest(data):
+    return hashlib.sha1(data).hexdigest()
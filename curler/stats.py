@@ -0,0 +1,30 @@
+from twisted.python import log
+
+
+class Stats(object):
+    """Counters and gauges which are periodically written to the log.
+
+    Counters only ever go up, gauges hold the last value they were set to.
+    Names are dotted paths, e.g. 'queue.localhost:4730.curler.queued'."""
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+
+    def incr(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def timing(self, name, ms):
+        self.incr('%s.count' % name)
+        self.incr('%s.total_ms' % name, ms)
+
+    def report(self):
+        values = dict(self.counters)
+        values.update(self.gauges)
+        if not values:
+            return
+        log.msg('STATS: %s' % ' '.join('%s=%s' % (k, values[k])
+                                       for k in sorted(values)))
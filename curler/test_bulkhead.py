@@ -0,0 +1,43 @@
+from twisted.trial import unittest
+
+from . import bulkhead
+
+class ParseConcurrencyTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEquals({"a": 2, "b": 0.25},
+                          bulkhead.parse_concurrency("a=2,b=25%"))
+
+    def test_parseNoSlots(self):
+        # these would leave every job for the method waiting forever
+        for value in ("a=0", "a=-1", "a=0%"):
+            self.assertRaises(ValueError, bulkhead.parse_concurrency, value)
+
+class BulkheadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bh = bulkhead.Bulkhead({"slow": 1, "share": 0.5}, 1)
+
+    def test_unlimited(self):
+        for i in range(10):
+            self.assertTrue(self.bh.acquire("fast", 5).called)
+        self.assertEquals(10, self.bh.running["fast"])
+
+    def test_limit(self):
+        self.assertTrue(self.bh.acquire("slow", 5).called)
+        self.assertFalse(self.bh.full())
+        d = self.bh.acquire("slow", 5)
+        self.assertFalse(d.called)
+        self.assertTrue(self.bh.full())
+
+        self.bh.release("slow")
+        self.assertTrue(d.called)
+        self.assertFalse(self.bh.full())
+        self.assertEquals(1, self.bh.running["slow"])
+        self.bh.release("slow")
+        self.assertEquals(0, self.bh.running["slow"])
+
+    def test_share(self):
+        self.assertEquals(2, self.bh.limit("share", 5))
+        self.assertEquals(1, self.bh.limit("share", 1))
+        self.assertEquals(None, self.bh.limit("other", 5))
@@ -0,0 +1,18 @@
+from twisted.trial import unittest
+
+from . import compression
+
+class CompressionTest(unittest.TestCase):
+
+    def test_roundTrip(self):
+        data = b'{"response": "%s"}' % (b'x' * 1000)
+        compressed = compression.gzip(data)
+        self.assertTrue(compressed.startswith(compression.GZIP_MAGIC))
+        self.assertTrue(len(compressed) < len(data))
+        self.assertEquals(data, compression.gunzip(compressed))
+
+    def test_decodeResult(self):
+        data = b'{"status": 200}'
+        self.assertEquals(data, compression.decode_result(data))
+        self.assertEquals(data,
+                          compression.decode_result(compression.gzip(data)))
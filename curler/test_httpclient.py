@@ -0,0 +1,69 @@
+from twisted.internet import defer, reactor
+from twisted.web import server
+from twisted.web.client import ResponseNeverReceived
+from twisted.web.error import InfiniteRedirection
+
+from . import httpclient
+from .test_unixsocket import BackendTestCase, EchoResource
+
+class HTTPBackendTest(BackendTestCase):
+
+    def setUp(self):
+        self.port = reactor.listenTCP(0, server.Site(EchoResource()),
+                                      interface='127.0.0.1')
+        self.url = 'http://127.0.0.1:%d' % self.port.getHost().port
+        self.backend = httpclient.HTTPBackend(2)
+
+    def tearDown(self):
+        d = self.backend.close()
+        d.addCallback(lambda x: self.port.stopListening())
+        return d
+
+    def test_post(self):
+        d = self.backend.post(self.url + '/jobs/thing', b'data=hi',
+                              {'Content-Type':
+                                   'application/x-www-form-urlencoded'})
+        d.addCallback(self.assertResponse, 201, b'/jobs/thing hi')
+        return d
+
+    def test_postReusesConnection(self):
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        d = self.backend.post(self.url + '/jobs/thing', b'data=1', headers)
+        d.addCallback(lambda x: self.backend.post(self.url + '/jobs/thing',
+                                                  b'data=2', headers))
+        d.addCallback(self.assertResponse, 201, b'/jobs/thing 2')
+        d.addCallback(lambda x: self.assertEquals(
+            1, sum(len(c) for c in self.backend.pool._connections.values())))
+        return d
+
+    def test_postRedirect(self):
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        ds = []
+        for code in [301, 302, 307, 308]:
+            d = self.backend.post(self.url + '/redirect/%d' % code,
+                                  b'data=hi', headers)
+            d.addCallback(self.assertResponse, 201, b'/jobs/moved hi')
+            ds.append(d)
+        return defer.gatherResults(ds)
+
+    def test_postSeeOther(self):
+        d = self.backend.post(self.url + '/redirect/303', b'data=hi', {})
+        d.addCallback(self.assertResponse, 201, b'/jobs/moved GET')
+        return d
+
+    def test_postRedirectLoop(self):
+        d = self.backend.post(self.url + '/loop', b'data=hi', {})
+        return self.assertFailure(d, InfiniteRedirection)
+
+    def test_postTimeout(self):
+        d = self.backend.post(self.url + '/hang', b'data=hi', {}, 0.1)
+        return self.assertFailure(d, ResponseNeverReceived)
+
+    def test_postGzip(self):
+        backend = httpclient.HTTPBackend(1, True)
+        self.addCleanup(backend.close)
+        d = backend.post(self.url + '/jobs/thing', b'data=hi',
+                         {'Content-Type':
+                              'application/x-www-form-urlencoded'})
+        d.addCallback(self.assertResponse, 201, b'/jobs/thing hi')
+        return d
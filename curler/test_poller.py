@@ -0,0 +1,87 @@
+from twisted.internet import defer, task
+from twisted.trial import unittest
+
+from . import poller
+from .stats import Stats
+from .twisted_gears.test_client import ExpectedFailure
+
+class FakeClient(object):
+
+    def __init__(self):
+        self.num_workers = 2
+        self.scaled = []
+
+    def autoscale(self, queued, running, workers):
+        self.scaled.append((queued, running, workers))
+
+class FakeService(object):
+
+    def __init__(self):
+        self.gearmand_servers = ['a:1', 'b:1']
+        self.job_queues = ['q1', 'q2']
+        self.clients = {'a:1': FakeClient()}
+        self.autoscale = True
+        self.stats = Stats()
+
+class QueuePollerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = FakeService()
+        self.poller = poller.QueuePoller(self.service, 5)
+        self.status = {'a:1': {'q1': (10, 2, 3), 'q2': (4, 1, 2),
+                               'other': (100, 0, 1)},
+                       'b:1': {}}
+        self.polled = []
+        self.poller.get_status = self.get_status
+
+    def get_status(self, server):
+        self.polled.append(server)
+        if server not in self.status:
+            return defer.fail(ExpectedFailure('connection refused'))
+        return defer.succeed(self.status[server])
+
+    def test_pollServer(self):
+        d = self.poller.poll_server('a:1')
+
+        def _verify(x):
+            gauges = self.service.stats.gauges
+            self.assertEquals(10, gauges['queue.a:1.q1.queued'])
+            self.assertEquals(1, gauges['queue.a:1.q2.running'])
+            self.assertEquals(2, gauges['queue.a:1.q2.workers'])
+            self.assertNotIn('queue.a:1.other.queued', gauges)
+            self.assertEquals(2, gauges['workers.a:1'])
+            # queues are added up, workers are counted once
+            self.assertEquals([(14, 3, 3)],
+                              self.service.clients['a:1'].scaled)
+        d.addCallback(_verify)
+        return d
+
+    def test_pollServerNoAutoscale(self):
+        self.service.autoscale = False
+        d = self.poller.poll_server('a:1')
+        d.addCallback(lambda x: self.assertEquals(
+            [], self.service.clients['a:1'].scaled))
+        return d
+
+    def test_pollServerUnknownQueues(self):
+        d = self.poller.poll_server('b:1')
+        d.addCallback(lambda x: self.assertEquals(
+            0, self.service.stats.gauges['queue.b:1.q1.queued']))
+        return d
+
+    def test_pollServerFailed(self):
+        d = self.poller.poll_server('c:1')
+        d.addCallback(lambda x: self.assertEquals(
+            {}, self.service.stats.gauges))
+        return d
+
+    def test_loop(self):
+        clock = task.Clock()
+        self.poller.loop.clock = clock
+        self.poller.start()
+        self.assertEquals(['a:1', 'b:1'], self.polled)
+        clock.advance(5)
+        self.assertEquals(['a:1', 'b:1'] * 2, self.polled)
+        self.poller.stop()
+        clock.advance(5)
+        self.assertEquals(4, len(self.polled))
@@ -0,0 +1,35 @@
+import json
+import os
+from twisted.trial import unittest
+from twisted.python import log
+
+from . import profiler
+
+class ProfilerTest(unittest.TestCase):
+
+    def test_categorize(self):
+        self.assertEquals('gearman', profiler.categorize(
+            '/x/curler/twisted_gears/client.py', '_completed'))
+        self.assertEquals('json', profiler.categorize(
+            '~', "<method 'encode' of '_json.Encoder' objects>"))
+        self.assertEquals('http client', profiler.categorize(
+            '/x/twisted/web/client.py', 'getPage'))
+        self.assertEquals('curler', profiler.categorize(
+            '/x/curler/service.py', 'handle_job'))
+        self.assertEquals('other', profiler.categorize('~', 'len'))
+
+    def test_profile(self):
+        messages = []
+        log.addObserver(messages.append)
+        self.addCleanup(log.removeObserver, messages.append)
+
+        p = profiler.Profiler(10, self.mktemp())
+        os.mkdir(p.output_dir)
+        p.start()
+        json.dumps({'a': list(range(100))})
+        p.stop()
+
+        self.assertEquals(1, len(os.listdir(p.output_dir)))
+        text = '\n'.join(''.join(m['message']) for m in messages)
+        self.assertIn('Profile breakdown', text)
+        self.assertIn('json', text)
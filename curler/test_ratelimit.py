@@ -0,0 +1,82 @@
+from twisted.trial import unittest
+from twisted.internet import task
+
+from . import ratelimit
+
+class ParseLimitsTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEquals({"a": (10.0, None),
+                           "http://b:80/jobs": (0.5, 2.0)},
+                          ratelimit.parse_limits("a=10,http://b:80/jobs=0.5:2"))
+
+    def test_parseEmpty(self):
+        self.assertEquals({}, ratelimit.parse_limits(None))
+
+    def test_parseZeroRate(self):
+        self.assertRaises(ValueError, ratelimit.parse_limits, "a=0")
+        self.assertRaises(ValueError, ratelimit.parse_limits, "a=-1:2")
+
+    def test_parseSmallBurst(self):
+        # never adds up to a whole token, so jobs would wait forever
+        self.assertRaises(ValueError, ratelimit.parse_limits, "a=0.5:0.5")
+        self.assertEquals({"a": (0.5, 1.0)},
+                          ratelimit.parse_limits("a=0.5:1"))
+
+class TokenBucketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.bucket = ratelimit.TokenBucket(2, 2, self.clock)
+        self.fired = []
+
+    def acquire(self, n):
+        for i in range(n):
+            self.bucket.acquire().addCallback(self.fired.append)
+
+    def test_burst(self):
+        self.acquire(3)
+        self.assertEquals(2, len(self.fired))
+        self.clock.advance(0.5)
+        self.assertEquals(3, len(self.fired))
+
+    def test_rate(self):
+        self.acquire(6)
+        self.assertEquals(2, len(self.fired))
+        self.clock.advance(1)
+        self.assertEquals(4, len(self.fired))
+        self.clock.advance(1)
+        self.assertEquals(6, len(self.fired))
+        self.assertEquals([], self.clock.getDelayedCalls())
+
+    def test_delay(self):
+        self.assertEquals(0, self.bucket.delay())
+        self.acquire(3)
+        self.assertEquals(1, self.bucket.delay())
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.limiter = ratelimit.RateLimiter({"slow": (1, 1)},
+                                             {"http://a": (1, 1)},
+                                             self.clock)
+
+    def test_unlimited(self):
+        d = self.limiter.wait("fast", "http://b")
+        d.addCallback(lambda x: self.assertEquals(0, x))
+        return d
+
+    def test_wait(self):
+        self.limiter.wait("slow", "http://b")
+        d = self.limiter.wait("slow", "http://b")
+        self.clock.advance(1)
+        d.addCallback(lambda x: self.assertEquals(1, x))
+        return d
+
+    def test_chooseBaseUrl(self):
+        self.limiter.wait("fast", "http://a")
+        for i in range(10):
+            self.assertEquals("http://b",
+                              self.limiter.choose_base_url(["http://a",
+                                                            "http://b"]))
@@ -0,0 +1,53 @@
+from twisted.trial import unittest
+from twisted.internet import defer
+
+from . import recorder, replay
+from .twisted_gears.client import _GearmanJob
+
+class FakeGearmanClient(object):
+
+    def __init__(self):
+        self.submitted = []
+        self.pending = []
+
+    def submitBackground(self, function, data, unique_id=b''):
+        self.submitted.append((function, data))
+        d = defer.Deferred()
+        self.pending.append(d)
+        return d
+
+class RecordReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = self.mktemp()
+        self.recorder = recorder.JobRecorder(self.path)
+        self.recorder.open()
+        for i in range(3):
+            job = _GearmanJob(b'H:%d\0curler\0{"method": "m%d", "data": 1}'
+                              % (i, i))
+            self.recorder.record(job, 1000 + i, 10, {'status': 200,
+                                                     'response': 'OK'})
+        self.recorder.close()
+        self.gearman = FakeGearmanClient()
+
+    def test_record(self):
+        jobs = list(replay.read_jobs(self.path))
+        self.assertEquals(3, len(jobs))
+        self.assertEquals({'queue': 'curler',
+                           'data': '{"method": "m0", "data": 1}',
+                           'method': 'm0', 'time': 1000, 'ms': 10,
+                           'status': 200, 'size': 2}, jobs[0])
+
+    def test_replayMaxSpeed(self):
+        d = replay.replay(self.gearman, replay.read_jobs(self.path), 0, 2,
+                          'other')
+        # the window stops us at two outstanding submissions
+        self.assertEquals(2, len(self.gearman.submitted))
+        self.gearman.pending[0].callback(None)
+        self.assertEquals(3, len(self.gearman.submitted))
+        for p in self.gearman.pending[1:]:
+            p.callback(None)
+        self.assertEquals([('other', b'{"method": "m%d", "data": 1}' % i)
+                           for i in range(3)], self.gearman.submitted)
+        d.addCallback(self.assertEquals, 3)
+        return d
@@ -0,0 +1,600 @@
+import json
+import struct
+from twisted.internet import defer, task
+from twisted.trial import unittest
+
+from . import service
+from .twisted_gears import constants
+from .twisted_gears.client import _GearmanJob
+from .twisted_gears.test_client import ExpectedFailure, TestTransport
+
+class ServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # workers are started with callLater, this keeps them from running
+        self.clock = task.Clock()
+        self.patch(service, 'reactor', self.clock)
+
+    def makeService(self, **kwargs):
+        kwargs.setdefault('stats_interval', 0)
+        return service.CurlerService(['http://a/jobs'], ['a:1'], ['q1'], 2,
+                                     **kwargs)
+
+    def connect(self, curler_service, server='a:1'):
+        curler_client = service.CurlerClient(
+            curler_service, server, curler_service.base_urls,
+            curler_service.job_queues, curler_service.num_workers)
+        curler_client.makeConnection(TestTransport())
+        return curler_client
+
+    def receive(self, curler_client, cmd, data):
+        curler_client.dataReceived(b'\0RES'
+                                   + struct.pack('>II', cmd, len(data))
+                                   + data)
+
+    def sent(self, curler_client):
+        """Get (cmd, data) for every packet sent, and forget them."""
+        received = curler_client.transport.received
+        curler_client.transport.received = []
+        return [(struct.unpack(">II", received[i + 1])[0], received[i + 2])
+                for i in range(0, len(received), 3)]
+
+class DeadlineTest(ServiceTestCase):
+
+    def setUp(self):
+        super(DeadlineTest, self).setUp()
+        self.now = 1000.0
+        self.patch(service, 'time', lambda: self.now)
+        self.service = self.makeService(max_job_age=60)
+        self.client = self.connect(self.service)
+        self.posts = []
+        self.client._post = self.post
+
+    def post(self, url, postdata, headers, timeout=None):
+        d = defer.Deferred()
+        self.posts.append((headers, timeout, d))
+        return d
+
+    def request(self, **job_data):
+        job_data.update(method='m', data=1)
+        return self.client._make_request('H:1', json.dumps(job_data))
+
+    def test_getDeadline(self):
+        self.assertEquals(990, self.client.get_deadline({'deadline': 990}))
+        self.assertEquals(1050, self.client.get_deadline({'enqueued_at': 990}))
+        # an explicit deadline wins
+        self.assertEquals(2000, self.client.get_deadline({'deadline': 2000,
+                                                          'enqueued_at': 990}))
+        self.assertEquals(None, self.client.get_deadline({}))
+
+    def test_getDeadlineNoMaxAge(self):
+        self.service.max_job_age = 0
+        self.assertEquals(None, self.client.get_deadline({'enqueued_at': 990}))
+
+    def test_expired(self):
+        d = self.request(deadline=990.5)
+        d.addCallback(self.assertEquals,
+                      {"error": "Job deadline passed 9.500s ago",
+                       "expired": True})
+        d.addCallback(lambda x: self.assertEquals([], self.posts))
+        return d
+
+    def test_expiredMaxJobAge(self):
+        d = self.request(enqueued_at=900)
+        d.addCallback(lambda x: self.assertTrue(x['expired']))
+        d.addCallback(lambda x: self.assertEquals([], self.posts))
+        return d
+
+    def test_badDeadline(self):
+        d = self.request(deadline='soon')
+        d.addCallback(self.assertEquals,
+                      {"error": "\"deadline\" and \"enqueued_at\" must be "
+                                "Unix timestamps"})
+        return d
+
+    def test_nonFiniteDeadline(self):
+        for job_data in [{'deadline': 'nan'}, {'deadline': 'inf'},
+                         {'enqueued_at': '-inf'}, {'enqueued_at': 'NaN'}]:
+            self.assertRaises(ValueError, self.client.get_deadline, job_data)
+        d = self.request(deadline='inf')
+        d.addCallback(lambda x: self.assertIn('must be Unix timestamps',
+                                              x['error']))
+        d.addCallback(lambda x: self.assertEquals([], self.posts))
+        return d
+
+    def test_timeRemaining(self):
+        d = self.request(enqueued_at=990)
+        headers, timeout, post = self.posts[0]
+        self.assertEquals(50, timeout)
+        self.assertEquals('50.000', headers['X-Curler-Time-Remaining'])
+        post.callback((200, {}, b'OK'))
+        d.addCallback(lambda x: self.assertEquals(200, x['status']))
+        return d
+
+    def test_noTimeRemainingWithoutDeadline(self):
+        d = self.request()
+        headers, timeout, post = self.posts[0]
+        self.assertEquals(None, timeout)
+        self.assertNotIn('X-Curler-Time-Remaining', headers)
+        post.callback((200, {}, b'OK'))
+        return d
+
+    def test_timeout(self):
+        d = self.request(deadline=1010)
+        # the backend took too long and the request was cancelled
+        self.now = 1010.25
+        self.posts[0][2].errback(defer.CancelledError())
+        d.addCallback(self.assertEquals,
+                      {"error": "Job deadline passed 0.250s ago",
+                       "expired": True})
+        return d
+
+    def test_failedBeforeDeadline(self):
+        d = self.request(deadline=1010)
+        self.posts[0][2].errback(ExpectedFailure('boom'))
+        d.addCallback(lambda x: self.assertNotIn('expired', x))
+        return d
+
+class AutoscaleTest(ServiceTestCase):
+
+    def setUp(self):
+        super(AutoscaleTest, self).setUp()
+        self.service = self.makeService(max_workers=6, status_interval=5)
+        self.client = self.connect(self.service)
+
+    def test_scaleUp(self):
+        # 8 jobs waiting between 2 worker connections
+        self.client.autoscale(10, 2, 2)
+        self.assertEquals(4, self.client.num_workers)
+        self.assertEquals(4, self.client.running_workers)
+
+    def test_noWorkers(self):
+        self.client.autoscale(3, 0, 0)
+        self.assertEquals(3, self.client.num_workers)
+
+    def test_busyWorkersKept(self):
+        self.client.busy_workers = 3
+        self.client.autoscale(3, 3, 1)
+        self.assertEquals(3, self.client.num_workers)
+
+    def test_clamped(self):
+        self.client.autoscale(100, 0, 1)
+        self.assertEquals(6, self.client.num_workers)
+        self.client.autoscale(0, 0, 1)
+        self.assertEquals(2, self.client.num_workers)
+        # surplus workers stop after their current job
+        self.assertEquals(6, self.client.running_workers)
+
+class BulkheadTest(ServiceTestCase):
+
+    def setUp(self):
+        super(BulkheadTest, self).setUp()
+        self.service = self.makeService(method_concurrency={'slow': 1},
+                                        method_queue_size=2)
+        self.client = self.connect(self.service)
+        self.started = []
+        self.client._run_worker = lambda: self.started.append(1)
+        self.posts = []
+        self.client._post = self.post
+
+    def post(self, url, postdata, headers, timeout=None):
+        d = defer.Deferred()
+        self.posts.append(d)
+        return d
+
+    def request(self, method):
+        return self.client._make_request(
+            'H:1', json.dumps({'method': method, 'data': 1}))
+
+    def test_borrowWorker(self):
+        self.request('slow')
+        self.assertEquals(2, self.client.running_workers)
+        # another worker takes jobs for other methods while this one waits
+        waiting = self.request('slow')
+        self.assertEquals(1, self.client.borrowed_workers)
+        self.assertEquals(3, self.client.running_workers)
+        self.assertEquals(1, len(self.started))
+
+        self.posts[0].callback((200, {}, b'OK'))
+        self.assertEquals(0, self.client.borrowed_workers)
+        self.assertEquals(2, len(self.posts))
+        self.posts[1].callback((200, {}, b'OK'))
+        waiting.addCallback(lambda x: self.assertEquals(200, x['status']))
+        # the extra worker stops after its job
+        self.assertFalse(self.client._keep_working())
+        self.assertEquals(2, self.client.running_workers)
+        return waiting
+
+    def test_queueFull(self):
+        self.request('slow')
+        self.request('slow')
+        third = self.request('slow')
+        # no extra worker for the job which filled the queue, and the
+        # others stop grabbing jobs so they stay in gearmand
+        self.assertEquals(2, self.client.borrowed_workers)
+        self.assertEquals(3, self.client.running_workers)
+        self.assertFalse(self.client._keep_working())
+        self.assertFalse(self.client._keep_working())
+        self.assertEquals(1, self.client.running_workers)
+        self.assertFalse(third.called)
+
+        # once a job gets its slot there's room again
+        self.posts[0].callback((200, {}, b'OK'))
+        self.assertEquals(1, self.client.borrowed_workers)
+        self.assertEquals(3, self.client.running_workers)
+        self.assertEquals(3, len(self.started))
+        self.assertTrue(self.client._keep_working())
+
+class CurlerServiceTest(ServiceTestCase):
+
+    def test_wsgiThreads(self):
+        curler_service = service.CurlerService(
+            ['http://a/jobs'], ['a:1', 'b:1', 'c:1'], ['q1'], 2,
+            stats_interval=0, max_workers=5,
+            wsgi_app='curler.test_wsgi.application')
+        self.assertEquals(15, curler_service.wsgi.pool.max)
+
+class ReconfigureTest(ServiceTestCase):
+
+    def setUp(self):
+        super(ReconfigureTest, self).setUp()
+        self.service = self.makeService()
+        self.client = self.connect(self.service)
+        self.assertEquals([(constants.CAN_DO, b'q1')], self.sent(self.client))
+
+    def test_reconfigure(self):
+        self.client.reconfigure(['http://b/jobs'], ['q2'], 3)
+        self.assertEquals([(constants.CAN_DO, b'q2'),
+                           (constants.CANT_DO, b'q1')],
+                          self.sent(self.client))
+        self.assertEquals(['http://b/jobs'], self.client.base_urls)
+        self.assertEquals(['q2'], self.client.job_queues)
+        self.assertEquals(3, self.client.running_workers)
+        # jobs for q1 which were already on their way still get done
+        self.assertEquals([b'q1', b'q2'], sorted(self.client.worker.functions))
+
+    def test_reconfigureFewerWorkers(self):
+        self.client.reconfigure(self.client.base_urls, ['q1'], 1)
+        self.assertEquals([], self.sent(self.client))
+        # the surplus worker stops once its current job is done
+        self.assertEquals(2, self.client.running_workers)
+        self.assertFalse(self.client._keep_working())
+        self.assertTrue(self.client._keep_working())
+        self.assertEquals(1, self.client.running_workers)
+
+    def test_reload(self):
+        config_file = self.mktemp()
+        with open(config_file, 'w') as f:
+            json.dump({'base-urls': 'http://b/jobs,http://c/jobs',
+                       'job-queue': ['q1', 'q2'],
+                       'num-workers': 4}, f)
+        self.service.config_file = config_file
+        factory = service.CurlerClientFactory(
+            self.service, 'a:1', self.service.base_urls,
+            self.service.job_queues, self.service.num_workers)
+        self.service.factories['a:1'] = factory
+
+        self.service.reload()
+        self.assertEquals([(constants.CAN_DO, b'q2')], self.sent(self.client))
+        self.assertEquals(['http://b/jobs', 'http://c/jobs'],
+                          self.client.base_urls)
+        self.assertEquals(4, self.client.running_workers)
+        self.assertEquals(self.client.base_urls, factory.base_urls)
+        self.assertEquals(['q1', 'q2'], factory.job_queues)
+        self.assertEquals(4, factory.num_workers)
+        self.assertEquals(
+            4, self.service.http_backend.pool.maxPersistentPerHost)
+
+    def test_reloadResizesPools(self):
+        self.service.wsgi = service.WSGIDispatcher.from_name(
+            'curler.test_wsgi.application', self.service.max_connections())
+        backend = self.service.get_unix_backend('/tmp/app.sock')
+        config_file = self.mktemp()
+        with open(config_file, 'w') as f:
+            json.dump({'num-workers': 3, 'max-workers': 6}, f)
+        self.service.config_file = config_file
+
+        self.service.reload()
+        self.assertEquals(
+            6, self.service.http_backend.pool.maxPersistentPerHost)
+        self.assertEquals(6, backend.pool.maxPersistentPerHost)
+        self.assertEquals(6, self.service.wsgi.pool.max)
+
+    def test_reloadBadConfig(self):
+        config_file = self.mktemp()
+        with open(config_file, 'w') as f:
+            f.write('{"num-workers": ')
+        self.service.config_file = config_file
+
+        self.service.reload()
+        self.assertEquals([], self.sent(self.client))
+        self.assertEquals(['http://a/jobs'], self.client.base_urls)
+        self.assertEquals(2, self.client.running_workers)
+
+    def test_reloadBadValue(self):
+        config_file = self.mktemp()
+        with open(config_file, 'w') as f:
+            json.dump({'base-urls': 'http://b/jobs', 'job-queue': 'q2',
+                       'num-workers': 'lots'}, f)
+        self.service.config_file = config_file
+
+        # none of the file is applied
+        self.service.reload()
+        self.assertEquals([], self.sent(self.client))
+        self.assertEquals(['http://a/jobs'], self.service.base_urls)
+        self.assertEquals(['q1'], self.service.job_queues)
+        self.assertEquals(['http://a/jobs'], self.client.base_urls)
+
+class DrainTest(ServiceTestCase):
+
+    def setUp(self):
+        super(DrainTest, self).setUp()
+        self.patch(service, 'time', self.clock.seconds)
+        self.service = self.makeService(spool_file=self.mktemp())
+        self.service.spool.open()
+        self.addCleanup(self.service.spool.close)
+        self.client = self.connect(self.service)
+        self.sent(self.client)
+        self.posts = []
+        self.client._post = self.post
+        # the connection goes away a little after we close it
+        self.client.transport.loseConnection = lambda: self.clock.callLater(
+            0.05, self.client.connectionLost, ExpectedFailure())
+
+    def post(self, url, postdata, headers, timeout=None):
+        d = defer.Deferred()
+        self.posts.append(d)
+        return d
+
+    def doJob(self, handle):
+        return self.client.worker._finishJob(_GearmanJob(
+            handle + b'\0q1\0{"method": "m", "data": 1}'))
+
+    def test_drainIdle(self):
+        d = self.service.stopService()
+        self.assertEquals([(constants.RESET_ABILITIES, b'')],
+                          self.sent(self.client))
+        self.clock.advance(0.05)
+        self.assertTrue(d.called)
+        self.assertFalse(self.client.connected)
+
+    def test_drainWaitsForJobs(self):
+        self.doJob(b'H:1')
+        self.client.worker._grab()
+        self.sent(self.client)
+        d = self.service.drain()
+        self.assertEquals([(constants.RESET_ABILITIES, b'')],
+                          self.sent(self.client))
+
+        self.posts[0].callback((200, {}, b'OK'))
+        self.assertEquals(constants.WORK_COMPLETE,
+                          self.sent(self.client)[0][0])
+        self.clock.advance(0.1)
+        # the GRAB_JOB could still bring a job
+        self.assertTrue(self.client.connected)
+        self.receive(self.client, constants.NO_JOB, b'')
+        self.clock.advance(0.1)
+        self.clock.advance(0.05)
+        self.assertFalse(self.client.connected)
+        self.assertTrue(d.called)
+
+    def test_drainTimeout(self):
+        self.doJob(b'H:1')
+        self.doJob(b'H:2')
+        d = self.service.stopService()
+        self.clock.pump([0.1] * 300)
+        self.assertTrue(self.client.connected)
+        self.assertFalse(d.called)
+
+        # finished after the connection was lost, so it's spooled
+        self.clock.advance(0.05)
+        self.posts[0].callback((200, {}, b'OK'))
+        self.assertFalse(d.called)
+        # the other is abandoned and gearmand will hand it out again
+        self.clock.advance(0.1)
+        self.assertTrue(d.called)
+        self.assertEquals(set(), self.client.requests)
+
+        spool = service.ResultSpool(self.service.spool.path)
+        spool.open()
+        self.addCleanup(spool.close)
+        self.assertEquals([b'H:1'], [handle for handle, data
+                                     in spool.pending('a:1')])
+
+    def test_drainNoTimeout(self):
+        self.service.drain_timeout = 0
+        self.doJob(b'H:1')
+        self.service.drain()
+        self.assertEquals([], self.sent(self.client))
+        self.clock.advance(0.05)
+        self.clock.advance(0.1)
+        self.assertTrue(self.client.abandoned)
+
+    def test_reloadWhileDraining(self):
+        config_file = self.mktemp()
+        with open(config_file, 'w') as f:
+            json.dump({'job-queue': ['q1', 'q2']}, f)
+        self.service.config_file = config_file
+
+        self.service.drain()
+        self.sent(self.client)
+        self.service.reload()
+        self.assertEquals([], self.sent(self.client))
+        self.assertEquals(['q1'], self.service.job_queues)
+
+class SpoolTest(ServiceTestCase):
+
+    def setUp(self):
+        super(SpoolTest, self).setUp()
+        self.service = self.makeService(spool_file=self.mktemp())
+        self.service.spool.open()
+        self.addCleanup(self.service.spool.close)
+        self.client = self.connect(self.service)
+        self.sent(self.client)
+        self.job = _GearmanJob(b'H:1\0q1\0{"method": "m", "data": 1}')
+
+    def test_spoolResult(self):
+        self.client.connectionLost(ExpectedFailure())
+        self.client.worker._send_job_res(constants.WORK_COMPLETE, self.job,
+                                         b'result')
+        # gearmand will retry failed jobs anyway
+        self.client.worker._send_job_res(constants.WORK_FAIL, self.job)
+        self.assertEquals([], self.sent(self.client))
+        self.assertEquals([(b'H:1', b'result')],
+                          self.service.spool.pending('a:1'))
+
+    def test_spooledResultSentWhenJobComesBack(self):
+        self.client.connectionLost(ExpectedFailure())
+        self.client.worker._send_job_res(constants.WORK_COMPLETE, self.job,
+                                         b'result')
+
+        reconnected = self.connect(self.service)
+        self.sent(reconnected)
+        reconnected._make_request = lambda handle, data: self.fail('POSTed')
+        d = reconnected.worker.doJob()
+        self.receive(reconnected, constants.JOB_ASSIGN,
+                     b'H:1\0q1\0{"method": "m", "data": 1}')
+
+        def _verify(x):
+            self.assertEquals([(constants.GRAB_JOB, b''),
+                               (constants.WORK_COMPLETE, b'H:1\0result')],
+                              self.sent(reconnected))
+            self.assertEquals([], self.service.spool.pending('a:1'))
+            self.assertEquals(1, self.service.stats.counters['spool.sent'])
+        d.addCallback(_verify)
+        return d
+
+    def test_handleJobNotSpooled(self):
+        # a result for the same handle on another server isn't ours
+        self.service.spool.append('b:1', self.job, b'other')
+        requests = []
+        self.client._make_request = \
+            lambda handle, data: requests.append(handle) or \
+            defer.succeed({'status': 200})
+        d = self.client.handle_job(self.job)
+
+        def _verify(result):
+            self.assertEquals(['H:1'], requests)
+            self.assertEquals({'job_handle': 'H:1', 'status': 200},
+                              json.loads(result))
+            self.assertEquals([(b'H:1', b'other')],
+                              self.service.spool.pending('b:1'))
+        d.addCallback(_verify)
+        return d
+
+    def test_handleJobReusedHandle(self):
+        # gearmand restarted and gave the old handle to a new job
+        self.service.spool.append('a:1', self.job, b'stale')
+        requests = []
+        self.client._make_request = \
+            lambda handle, data: requests.append(data) or \
+            defer.succeed({'status': 200})
+        d = self.client.handle_job(
+            _GearmanJob(b'H:1\0q1\0{"method": "m", "data": 2}'))
+
+        def _verify(result):
+            self.assertEquals([b'{"method": "m", "data": 2}'], requests)
+            self.assertEquals({'job_handle': 'H:1', 'status': 200},
+                              json.loads(result))
+            self.assertEquals([], self.service.spool.pending('a:1'))
+        d.addCallback(_verify)
+        return d
+
+class SubmitTest(ServiceTestCase):
+
+    def setUp(self):
+        super(SubmitTest, self).setUp()
+        self.service = self.makeService()
+        self.client = self.connect(self.service)
+        self.sent(self.client)
+
+    def test_getSubmitsHeader(self):
+        headers = {'x-curler-submit': '[{"queue": "q", "data": 1}]'}
+        self.assertEquals(('OK', [{'queue': 'q', 'data': 1}]),
+                          self.client.get_submits(headers, 'OK'))
+
+    def test_getSubmitsEnvelope(self):
+        headers = {'content-type': 'application/vnd.curler+json; '
+                                   'charset=utf-8'}
+        body = json.dumps({'response': {'ok': True},
+                           'submit': [{'queue': 'q', 'data': 1}]})
+        self.assertEquals(('{"ok": true}', [{'queue': 'q', 'data': 1}]),
+                          self.client.get_submits(headers, body))
+
+    def test_getSubmitsEnvelopeStringResponse(self):
+        headers = {'content-type': 'application/vnd.curler+json'}
+        body = json.dumps({'response': 'OK'})
+        self.assertEquals(('OK', []), self.client.get_submits(headers, body))
+
+    def test_getSubmitsPlainResponse(self):
+        # only the envelope content type is unwrapped
+        body = json.dumps({'response': 'OK', 'submit': [{'queue': 'q'}]})
+        self.assertEquals((body, []), self.client.get_submits(
+            {'content-type': 'application/json'}, body))
+
+    def test_getSubmitsInvalid(self):
+        for headers, body in [({'x-curler-submit': 'nope'}, 'OK'),
+                              ({'x-curler-submit': '{"queue": "q"}'}, 'OK'),
+                              ({'content-type': 'application/vnd.curler+json'},
+                               'OK')]:
+            self.assertEquals(('OK', []),
+                              self.client.get_submits(headers, body))
+        self.assertEquals(3, self.service.stats.counters['submit.invalid'])
+
+    def test_submitJobs(self):
+        d = self.client.submit_jobs([
+            {'queue': 'q', 'data': {'method': 'm', 'data': 1}},
+            {'queue': 'q', 'data': 'raw', 'unique': 'u', 'priority': 'high'},
+            {'queue': 'q', 'data': 'x', 'unique': None, 'priority': 'low'},
+            {'data': 'no queue'},
+            'not a job'])
+        # all of them go out before gearmand answers any
+        self.assertEquals([
+            (constants.SUBMIT_JOB_BG, b'q\0\0{"method": "m", "data": 1}'),
+            (constants.SUBMIT_JOB_HIGH_BG, b'q\0u\0raw'),
+            (constants.SUBMIT_JOB_LOW_BG, b'q\0\0x')], self.sent(self.client))
+        self.receive(self.client, constants.JOB_CREATED, b'H:1')
+        self.receive(self.client, constants.ERROR, b'1\0queue full')
+        self.receive(self.client, constants.JOB_CREATED, b'H:3')
+
+        def _verify(created):
+            self.assertEquals(2, created)
+            self.assertEquals({'submit.invalid': 2, 'submit.jobs': 2,
+                               'submit.failed': 1},
+                              self.service.stats.counters)
+        d.addCallback(_verify)
+        return d
+
+    def test_submitJobsDisconnected(self):
+        self.client.connectionLost(ExpectedFailure())
+        d = self.client.submit_jobs([{'queue': 'q', 'data': 1}])
+        d.addCallback(self.assertEquals, 0)
+        d.addCallback(lambda x: self.assertEquals(
+            [], self.client.transport.received))
+        return d
+
+    def test_postJobSubmits(self):
+        self.client._post = lambda url, postdata, headers, timeout: \
+            defer.succeed((200, {'x-curler-submit':
+                                     '[{"queue": "q", "data": 1}]'}, b'OK'))
+        d = self.client._post_job('H:1', {'method': 'm', 'data': 1})
+        self.assertEquals([(constants.SUBMIT_JOB_BG, b'q\0\x001')],
+                          self.sent(self.client))
+        self.receive(self.client, constants.JOB_CREATED, b'H:2')
+        d.addCallback(lambda x: self.assertEquals(
+            (200, 'OK', 1), (x['status'], x['response'], x['submitted'])))
+        return d
+
+    def test_postJobSubmitsError(self):
+        self.client._post = lambda url, postdata, headers, timeout: \
+            defer.succeed((500, {'x-curler-submit':
+                                     '[{"queue": "q", "data": 1}]'}, b'no'))
+        d = self.client._post_job('H:1', {'method': 'm', 'data': 1})
+        self.assertEquals([], self.sent(self.client))
+
+        def _verify(x):
+            self.assertEquals((500, 'no'), (x['status'], x['response']))
+            self.assertNotIn('submitted', x)
+            self.assertEquals(1, self.service.stats.counters['submit.ignored'])
+        d.addCallback(_verify)
+        return d
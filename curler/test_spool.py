@@ -0,0 +1,74 @@
+from twisted.trial import unittest
+
+from . import spool
+from .twisted_gears.client import _GearmanJob
+
+def job(handle, data=b'{"method": "m", "data": 1}'):
+    return _GearmanJob(handle + b'\0q\0' + data)
+
+class ResultSpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = self.mktemp()
+        self.spool = spool.ResultSpool(self.path)
+        self.spool.open()
+
+    def tearDown(self):
+        self.spool.close()
+
+    def reopen(self):
+        self.spool.close()
+        self.spool = spool.ResultSpool(self.path)
+        self.spool.open()
+
+    def test_append(self):
+        self.spool.append('a:1', job(b'H:1'), b'some\0data')
+        self.spool.append('b:1', job(b'H:2'), b'other')
+        self.assertEquals([(b'H:1', b'some\0data')], self.spool.pending('a:1'))
+        self.reopen()
+        self.assertEquals([(b'H:1', b'some\0data')], self.spool.pending('a:1'))
+        self.assertEquals([(b'H:2', b'other')], self.spool.pending('b:1'))
+
+    def test_pop(self):
+        self.spool.append('a:1', job(b'H:1'), b'one')
+        self.spool.append('b:1', job(b'H:1'), b'other')
+        self.assertEquals(b'one', self.spool.pop('a:1', job(b'H:1')))
+        self.assertEquals(None, self.spool.pop('a:1', job(b'H:1')))
+        self.assertEquals([], self.spool.pending('a:1'))
+        self.assertEquals([(b'H:1', b'other')], self.spool.pending('b:1'))
+
+    def test_popReusedHandle(self):
+        # gearmand restarted and gave the handle to a different job
+        self.spool.append('a:1', job(b'H:1'), b'one')
+        self.assertEquals(None, self.spool.pop('a:1', job(b'H:1', b'other')))
+        self.assertEquals([], self.spool.pending('a:1'))
+
+    def test_popOtherFunction(self):
+        self.spool.append('a:1', job(b'H:1'), b'one')
+        self.assertEquals(None, self.spool.pop(
+            'a:1', _GearmanJob(b'H:1\0other\0{"method": "m", "data": 1}')))
+        self.assertEquals([], self.spool.pending('a:1'))
+
+    def test_compact(self):
+        self.spool.append('a:1', job(b'H:1'), b'one')
+        self.spool.append('a:1', job(b'H:2'), b'two')
+        self.spool.pop('a:1', job(b'H:1'))
+        self.spool.flush()
+        self.spool.append('a:1', job(b'H:3'), b'three')
+        self.reopen()
+        self.assertEquals([(b'H:2', b'two'), (b'H:3', b'three')],
+                          self.spool.pending('a:1'))
+
+    def test_compactExpired(self):
+        self.spool.append('a:1', job(b'H:1'), b'one')
+        self.spool.append('a:1', job(b'H:2'), b'two')
+        self.spool.entries[0]['time'] -= self.spool.max_age + 1
+        self.spool.compact()
+        self.reopen()
+        self.assertEquals([(b'H:2', b'two')], self.spool.pending('a:1'))
+
+    def test_partialLine(self):
+        self.spool.append('a:1', job(b'H:1'), b'one')
+        self.spool.file.write('{"server": "a:1", "hand')
+        self.reopen()
+        self.assertEquals([(b'H:1', b'one')], self.spool.pending('a:1'))
@@ -0,0 +1,85 @@
+from twisted.trial import unittest
+from twisted.internet import reactor
+from twisted.web import resource, server
+from twisted.web.client import ResponseNeverReceived
+
+from . import compression, unixsocket
+
+class EchoResource(resource.Resource):
+    isLeaf = True
+
+    def render_POST(self, request):
+        if request.path == b'/hang':
+            return server.NOT_DONE_YET
+        if request.path.startswith(b'/redirect'):
+            request.setResponseCode(int(request.path[-3:]))
+            request.setHeader(b'location', b'/jobs/moved')
+            return b''
+        if request.path == b'/loop':
+            request.redirect(b'/loop')
+            return b''
+        request.setResponseCode(201)
+        request.setHeader(b'X-Echo', b'yes')
+        body = request.path + b' ' + request.args[b'data'][0]
+        if b'gzip' in (request.getHeader(b'accept-encoding') or b''):
+            request.setHeader(b'content-encoding', b'gzip')
+            body = compression.gzip(body)
+        return body
+
+    def render_GET(self, request):
+        request.setResponseCode(201)
+        request.setHeader(b'X-Echo', b'yes')
+        return request.path + b' GET'
+
+class ParseUnixUrlTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEquals(('/run/app.sock', 'http://localhost/jobs/thing'),
+                          unixsocket.parse_unix_url(
+                              'unix:/run/app.sock:/jobs/thing'))
+
+    def test_parseNoPath(self):
+        self.assertEquals(('/run/app.sock', 'http://localhost/'),
+                          unixsocket.parse_unix_url('unix:/run/app.sock'))
+
+    def test_isUnixUrl(self):
+        self.assertTrue(unixsocket.is_unix_url('unix:/run/app.sock:/jobs'))
+        self.assertFalse(unixsocket.is_unix_url('http://localhost/jobs'))
+
+class BackendTestCase(unittest.TestCase):
+
+    def assertResponse(self, rv, status, body):
+        self.assertEquals((status, body), (rv[0], rv[2]))
+        self.assertEquals('yes', rv[1]['x-echo'])
+
+class UnixSocketBackendTest(BackendTestCase):
+
+    def setUp(self):
+        path = self.mktemp()
+        self.port = reactor.listenUNIX(path, server.Site(EchoResource()))
+        self.backend = unixsocket.UnixSocketBackend(path, 2)
+
+    def tearDown(self):
+        d = self.backend.close()
+        d.addCallback(lambda x: self.port.stopListening())
+        return d
+
+    def test_post(self):
+        d = self.backend.post('http://localhost/jobs/thing', b'data=hi',
+                              {'Content-Type':
+                                   'application/x-www-form-urlencoded'})
+        d.addCallback(self.assertResponse, 201, b'/jobs/thing hi')
+        return d
+
+    def test_postTimeout(self):
+        d = self.backend.post('http://localhost/hang', b'data=hi', {}, 0.1)
+        return self.assertFailure(d, ResponseNeverReceived)
+
+    def test_postGzip(self):
+        backend = unixsocket.UnixSocketBackend(self.port.port, 1, True)
+        self.addCleanup(backend.close)
+        d = backend.post('http://localhost/jobs/thing', b'data=hi',
+                         {'Content-Type':
+                              'application/x-www-form-urlencoded'})
+        d.addCallback(self.assertResponse, 201, b'/jobs/thing hi')
+        return d
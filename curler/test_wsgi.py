@@ -0,0 +1,48 @@
+from urllib.parse import parse_qs
+from twisted.trial import unittest
+
+from . import wsgi
+
+def application(environ, start_response):
+    length = int(environ['CONTENT_LENGTH'])
+    form = parse_qs(environ['wsgi.input'].read(length).decode('utf-8'))
+    if environ['PATH_INFO'] == '/jobs/fail':
+        start_response('500 Internal Server Error', [])
+        return [b'FAIL']
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    body = '%s %s %s %s' % (environ['PATH_INFO'], environ['HTTP_X_TEST'],
+                            form['job_handle'][0], form['data'][0])
+    return [body.encode('utf-8')]
+
+class WSGIDispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dispatcher = wsgi.WSGIDispatcher(application, 1)
+        self.headers = {'Content-Type': 'application/x-www-form-urlencoded',
+                        'X-Test': 'yey'}
+
+    def test_fromName(self):
+        d = wsgi.WSGIDispatcher.from_name('curler.test_wsgi.application', 1)
+        self.assertIdentical(application, d.application)
+
+    def test_call(self):
+        self.assertEquals((200, {'content-type': 'text/plain'},
+                           b'/jobs/do_thing yey H:1 {}'),
+                          self.dispatcher._call('http://localhost/jobs/do_thing',
+                                                b'job_handle=H%3A1&data=%7B%7D',
+                                                self.headers))
+
+    def test_callError(self):
+        self.assertEquals((500, {}, b'FAIL'),
+                          self.dispatcher._call('http://localhost/jobs/fail',
+                                                b'job_handle=H%3A1&data=%7B%7D',
+                                                self.headers))
+
+    def test_post(self):
+        self.dispatcher.start()
+        self.addCleanup(self.dispatcher.stop)
+        d = self.dispatcher.post('http://localhost/jobs/do_thing',
+                                 b'job_handle=H%3A1&data=1', self.headers)
+        d.addCallback(self.assertEquals, (200, {'content-type': 'text/plain'},
+                                          b'/jobs/do_thing yey H:1 1'))
+        return d
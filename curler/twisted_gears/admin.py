@@ -0,0 +1,67 @@
+"""
+Gearman administrative (text) protocol implementation.
+"""
+
+from collections import deque
+
+from twisted.internet import defer
+from twisted.protocols import basic
+
+__all__ = ['GearmanAdminProtocol', 'GearmanAdminError']
+
+class GearmanAdminError(Exception):
+    """Exception thrown when the server returns an ERR line."""
+    pass
+
+class GearmanAdminProtocol(basic.LineReceiver):
+    """Protocol for the line-based gearmand admin commands.
+
+    Commands are answered in the order they were sent, so outstanding
+    requests are kept in a queue just like GearmanProtocol does."""
+
+    delimiter = b"\n"
+
+    def connectionMade(self):
+        self.deferreds = deque()
+        self.lines = []
+
+    def connectionLost(self, reason):
+        for d in list(self.deferreds):
+            d.errback(reason)
+        self.deferreds.clear()
+
+    def send_command(self, command):
+        """Send a multi-line admin command and get a deferred for its lines."""
+        self.sendLine(command.encode('utf-8'))
+        d = defer.Deferred()
+        self.deferreds.append(d)
+        return d
+
+    def lineReceived(self, line):
+        line = line.decode('utf-8', 'replace').rstrip("\r")
+        if not self.lines and line.startswith("ERR "):
+            self.deferreds.popleft().errback(GearmanAdminError(line[4:]))
+        elif line == ".":
+            lines, self.lines = self.lines, []
+            self.deferreds.popleft().callback(lines)
+        else:
+            self.lines.append(line)
+
+    def status(self):
+        """Get the queue status for every function the server knows about.
+
+        Fires with a dict of function name to a (queued, running, workers)
+        tuple, where queued is the total number of jobs for the function
+        (including running ones) and workers is the number of workers
+        which can do it."""
+
+        def _parse(lines):
+            rv = {}
+            for line in lines:
+                parts = line.split("\t")
+                if len(parts) != 4:
+                    continue
+                rv[parts[0]] = tuple(int(x) for x in parts[1:])
+            return rv
+
+        return self.send_command("status").addCallback(_parse)
@@ -11,10 +11,16 @@ from twisted.internet import defer
 from twisted.protocols import stateful
 from twisted.python import log
 
-from constants import *
+from .constants import *
 
 __all__ = ['GearmanProtocol', 'GearmanWorker', 'GearmanClient']
 
+def _bytes(value):
+    """Encode text as UTF-8. Bytes are passed through untouched."""
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    return value
+
 class GearmanProtocol(stateful.StatefulProtocol):
     """Base protocol for handling gearman connections."""
 
@@ -29,14 +35,15 @@ class GearmanProtocol(stateful.StatefulProtocol):
         # connectionMade() gets called
         stateful.StatefulProtocol.makeConnection(self, transport)
 
-    def send_raw(self, cmd, data=''):
+    def send_raw(self, cmd, data=b''):
         """Send a command with the given data with no response."""
 
+        data = _bytes(data)
         self.transport.writeSequence([REQ_MAGIC,
                                       struct.pack(">II", cmd, len(data)),
                                       data])
 
-    def send(self, cmd, data=''):
+    def send(self, cmd, data=b''):
         """Send a command and get a deferred waiting for the response."""
         self.send_raw(cmd, data)
         d = defer.Deferred()
@@ -47,6 +54,7 @@ class GearmanProtocol(stateful.StatefulProtocol):
         return self._headerReceived, HEADER_LEN
 
     def connectionLost(self, reason):
+        self.connected = 0
         for d in list(self.deferreds):
             d.errback(reason)
         self.deferreds.clear()
@@ -81,7 +89,7 @@ class GearmanProtocol(stateful.StatefulProtocol):
     def unregister_unsolicited(self, cb):
         self.unsolicited_handlers.discard(cb)
 
-    def echo(self, data="hello"):
+    def echo(self, data=b"hello"):
         """Send an echo request."""
 
         return self.send(ECHO_REQ, data)
@@ -90,20 +98,34 @@ class _GearmanJob(object):
     """A gearman job."""
 
     def __init__(self, raw_data):
-        self.handle, self.function, self.data = raw_data.split("\0", 2)
+        self.handle, self.function, self.data = raw_data.split(b"\0", 2)
 
     def __repr__(self):
-        return "<GearmanJob %s func=%s with %d bytes of data>" % (self.handle,
-                                                                  self.function,
-                                                                  len(self.data))
+        return "<GearmanJob %s func=%s with %d bytes of data>" % (
+            self.handle.decode('utf-8', 'replace'),
+            self.function.decode('utf-8', 'replace'),
+            len(self.data))
 
 class GearmanWorker(object):
-    """A gearman worker."""
+    """A gearman worker.
 
-    def __init__(self, protocol):
+    When there's no work, getJob() callers queue up behind a single
+    PRE_SLEEP. A NOOP wakes only the first of them, and every job that gets
+    grabbed wakes one more, so a burst of jobs ramps up the number of
+    GRAB_JOBs instead of every idle caller grabbing at once. Set wake_all
+    to wake every sleeper on NOOP instead."""
+
+    def __init__(self, protocol, wake_all=False):
         self.protocol = protocol
         self.functions = {}
-        self.sleeping = None
+        self.sleeping = False
+        self.sleepers = deque()
+        self.wake_all = wake_all
+        self.counters = {'grab_job': 0, 'no_job': 0, 'job_assign': 0,
+                         'noop': 0}
+        # called with (cmd, job, data) for results which can't be sent
+        # because the connection is gone
+        self.undeliverable = None
         self.protocol.register_unsolicited(self._unsolicited)
 
     def setId(self, client_id):
@@ -113,47 +135,92 @@ class GearmanWorker(object):
     def registerFunction(self, name, func):
         """Register the ability to perform a function."""
 
+        name = _bytes(name)
         self.functions[name] = func
         self.protocol.send_raw(CAN_DO, name)
 
-    def _send_job_res(self, cmd, job, data=''):
-        self.protocol.send_raw(cmd, job.handle + "\0" + data)
+    def unregisterFunction(self, name):
+        """Give up the ability to perform a function.
+
+        Like resetAbilities(), the function is kept so that jobs which were
+        already on their way to us still get done."""
+
+        self.protocol.send_raw(CANT_DO, _bytes(name))
+
+    def resetAbilities(self):
+        """Tell the server we can't do anything anymore.
+
+        Registered functions are kept so that jobs which were already on
+        their way to us still get done."""
+
+        self.protocol.send_raw(RESET_ABILITIES)
+
+    def _send_job_res(self, cmd, job, data=b''):
+        data = _bytes(data)
+        if not self.protocol.connected and self.undeliverable:
+            self.undeliverable(cmd, job, data)
+            return
+        self.protocol.send_raw(cmd, job.handle + b"\0" + data)
 
     def _sleep(self):
+        d = defer.Deferred()
+        self.sleepers.append(d)
         if not self.sleeping:
-            self.sleeping = defer.Deferred()
+            self.sleeping = True
             self.protocol.send_raw(PRE_SLEEP)
-        return self.sleeping
+        return d
+
+    def _wake(self, count=1):
+        for i in range(min(count, len(self.sleepers))):
+            self.sleepers.popleft().callback(None)
 
     def _unsolicited(self, cmd, data):
-        assert cmd == NOOP
-        if self.sleeping:
-            self.sleeping.callback(None)
-            self.sleeping = None
+        # work packets are for a GearmanClient sharing our connection
+        if cmd != NOOP:
+            return
+        self.counters['noop'] += 1
+        self.sleeping = False
+        if self.wake_all:
+            self._wake(len(self.sleepers))
+        else:
+            self._wake()
+
+    def _grab(self):
+        # gearmand takes us out of sleep on any GRAB_JOB, so the next
+        # NO_JOB needs a new PRE_SLEEP
+        self.sleeping = False
+        self.counters['grab_job'] += 1
+        return self.protocol.send(GRAB_JOB)
 
     @defer.inlineCallbacks
     def getJob(self):
         """Get the next job."""
 
-        # If we're currently sleeping, attach to the existing sleep.
-        if self.sleeping:
+        # If others are waiting to be woken up, wait our turn behind them.
+        if self.sleepers:
             yield self._sleep()
 
-        stuff = yield self.protocol.send(GRAB_JOB)
+        stuff = yield self._grab()
         while stuff[0] == NO_JOB:
+            self.counters['no_job'] += 1
             yield self._sleep()
-            stuff = yield self.protocol.send(GRAB_JOB)
+            stuff = yield self._grab()
+        self.counters['job_assign'] += 1
+
+        # There may be more where that came from, so let another sleeper try.
+        self._wake()
         defer.returnValue(_GearmanJob(stuff[1]))
 
     @defer.inlineCallbacks
     def _finishJob(self, job):
         assert job
-        f = self.functions[job.function]
-        assert f
         try:
+            # a job for a function we never registered fails like any
+            # other error
+            f = self.functions[job.function]
             rv = yield f(job)
             if rv is None:
-                rv = ""
+                rv = b""
             self._send_job_res(WORK_COMPLETE, job, rv)
         except:
             etype, emsg, bt = sys.exc_info()
@@ -179,11 +246,11 @@ class _GearmanJobHandle(object):
 
     @property
     def work_data(self):
-        return ''.join(self._work_data)
+        return b''.join(self._work_data)
 
     @property
     def work_warning(self):
-        return ''.join(self._work_warning)
+        return b''.join(self._work_warning)
 
 class GearmanJobFailed(Exception):
     """Exception thrown when a job fails."""
@@ -205,7 +272,7 @@ class GearmanClient(object):
     def _unsolicited(self, cmd, data):
         if cmd in [ WORK_COMPLETE, WORK_FAIL,
                     WORK_DATA, WORK_WARNING ]:
-            pos = data.find("\0")
+            pos = data.find(b"\0")
             if pos == -1:
                 handle = data
             else:
@@ -231,38 +298,52 @@ class GearmanClient(object):
         def _submitted(x, d):
             self._register(x[1], _GearmanJobHandle(d))
 
-        d = self.protocol.send(cmd,
-                               function + "\0" + unique_id + "\0" + data)
+        d = self.protocol.send(cmd, b"\0".join([_bytes(function),
+                                                _bytes(unique_id),
+                                                _bytes(data)]))
 
         rv = defer.Deferred()
         d.addCallback(_submitted, rv)
 
         return rv
 
-    def submit(self, function, data, unique_id=''):
+    def submit(self, function, data, unique_id=b''):
         """Submit a job with the given function name and data."""
         return self._submit(SUBMIT_JOB, function, data, unique_id)
 
-    def submitHigh(self, function, data, unique_id=''):
+    def submitHigh(self, function, data, unique_id=b''):
         """Submit a high priority job with the given function name and data."""
         return self._submit(SUBMIT_JOB_HIGH, function, data, unique_id)
 
-    def submitLow(self, function, data, unique_id=''):
+    def submitLow(self, function, data, unique_id=b''):
         """Submit a low priority job with the given function name and data."""
         return self._submit(SUBMIT_JOB_LOW, function, data, unique_id)
 
+    def getStatus(self, job_handle):
+        """Get the status of a job.
+
+        Fires with a (known, running, numerator, denominator) tuple."""
+
+        def _parse(x):
+            parts = x[1].split(b"\0")
+            return (parts[1] == b"1", parts[2] == b"1",
+                    int(parts[3] or 0), int(parts[4] or 0))
+
+        return self.protocol.send(GET_STATUS, job_handle).addCallback(_parse)
+
     def _submitBg(self, cmd, function, data, unique_id):
-        return self.protocol.send(cmd,
-                                  function + "\0" + unique_id + "\0" + data)
+        return self.protocol.send(cmd, b"\0".join([_bytes(function),
+                                                   _bytes(unique_id),
+                                                   _bytes(data)]))
 
-    def submitBackground(self, function, data, unique_id=''):
+    def submitBackground(self, function, data, unique_id=b''):
         """Submit a job for background execution."""
         return self._submitBg(SUBMIT_JOB_BG, function, data, unique_id)
 
-    def submitBackgroundLow(self, function, data, unique_id=''):
+    def submitBackgroundLow(self, function, data, unique_id=b''):
         """Submit a job for background execution at low priority."""
         return self._submitBg(SUBMIT_JOB_LOW_BG, function, data, unique_id)
 
-    def submitBackgroundHigh(self, function, data, unique_id=''):
+    def submitBackgroundHigh(self, function, data, unique_id=b''):
         """Submit a job for background execution at high priority."""
         return self._submitBg(SUBMIT_JOB_HIGH_BG, function, data, unique_id)
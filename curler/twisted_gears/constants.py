@@ -2,8 +2,8 @@
 
 import struct
 
-REQ_MAGIC          = "\0REQ"
-RES_MAGIC          = "\0RES"
+REQ_MAGIC          = b"\0REQ"
+RES_MAGIC          = b"\0RES"
 
 CAN_DO             = 1
 CANT_DO            = 2
@@ -0,0 +1,49 @@
+from twisted.trial import unittest
+from twisted.internet import defer
+
+from . import admin
+from .test_client import TestTransport, ExpectedFailure
+
+class GearmanAdminProtocolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.trans = TestTransport()
+        self.ap = admin.GearmanAdminProtocol()
+        self.ap.makeConnection(self.trans)
+
+    def test_status(self):
+        d = self.ap.status()
+        self.assertEquals(b"status\n", b"".join(self.trans.received))
+        self.ap.dataReceived(b"curler\t10\t2\t3\n"
+                             b"other\t0\t0\t1\n"
+                             b".\n")
+        d.addCallback(lambda x:
+                          self.assertEquals({"curler": (10, 2, 3),
+                                             "other": (0, 0, 1)}, x))
+        return d
+
+    def test_statusEmpty(self):
+        d = self.ap.status()
+        self.ap.dataReceived(b".\n")
+        d.addCallback(lambda x: self.assertEquals({}, x))
+        return d
+
+    def test_statusInOrder(self):
+        d1 = self.ap.status()
+        d2 = self.ap.status()
+        self.ap.dataReceived(b"a\t1\t1\t1\n.\nb\t2\t2\t2\n.\n")
+        d1.addCallback(lambda x: self.assertEquals({"a": (1, 1, 1)}, x))
+        d2.addCallback(lambda x: self.assertEquals({"b": (2, 2, 2)}, x))
+        return defer.gatherResults([d1, d2])
+
+    def test_error(self):
+        d = self.ap.send_command("bogus")
+        self.ap.dataReceived(b"ERR UNKNOWN_COMMAND Unknown+server+command\n")
+        return self.assertFailure(d, admin.GearmanAdminError)
+
+    def test_connectionLost(self):
+        d = self.ap.status()
+        self.ap.connectionLost(ExpectedFailure())
+        d.addCallback(lambda x: unittest.FailTest())
+        d.addErrback(lambda x: x.trap(ExpectedFailure))
+        return d
@@ -1,17 +1,14 @@
 import struct
-from collections import deque
 
-from zope.interface import implements
+from zope.interface import implementer
 
 from twisted.trial import unittest
 from twisted.internet import interfaces, reactor, defer
 
-import client, constants
+from . import client, constants
 
+@implementer(interfaces.ITransport)
 class TestTransport(object):
-
-    implements(interfaces.ITransport)
-
     disconnecting = False
 
     def __init__(self):
@@ -44,14 +41,14 @@ class ProtocolTestCase(unittest.TestCase):
         self.gp.makeConnection(self.trans)
 
     def assertReceived(self, cmd, data):
-        self.assertEquals(["\0REQ",
+        self.assertEquals([b"\0REQ",
                            struct.pack(">II", cmd, len(data)),
                            data],
                           self.trans.received[:3])
         self.trans.received = self.trans.received[3:]
 
     def write_response(self, cmd, data):
-        self.gp.dataReceived("\0RES")
+        self.gp.dataReceived(b"\0RES")
         self.gp.dataReceived(struct.pack(">II", cmd, len(data)))
         self.gp.dataReceived(data)
 
@@ -63,17 +60,17 @@ class GearmanProtocolTest(ProtocolTestCase):
         self.assertEquals([], list(self.gp.unsolicited_handlers))
 
     def test_send_raw(self):
-        self.gp.send_raw(11, "some data")
-        self.assertReceived(11, "some data")
+        self.gp.send_raw(11, b"some data")
+        self.assertReceived(11, b"some data")
         self.assertEquals(0, len(self.gp.deferreds))
 
     def test_send(self):
-        self.gp.send(11, "some data")
-        self.assertReceived(11, "some data")
+        self.gp.send(11, b"some data")
+        self.assertReceived(11, b"some data")
         self.assertEquals(1, len(self.gp.deferreds))
 
     def test_connectionLost(self):
-        d = self.gp.send(11, "test")
+        d = self.gp.send(11, b"test")
         d.addCallback(lambda x: unittest.FailTest())
         d.addErrback(lambda x: x.trap(ExpectedFailure))
         self.gp.connectionLost(ExpectedFailure())
@@ -82,20 +79,20 @@ class GearmanProtocolTest(ProtocolTestCase):
     def test_badResponse(self):
         self.assertEquals(0, self.trans.disconnected)
         self.trans.shouldLoseConnection = True
-        self.gp.dataReceived("X" * constants.HEADER_LEN)
+        self.gp.dataReceived(b"X" * constants.HEADER_LEN)
         reactor.callLater(0, self.assertEquals, 1, self.trans.disconnected)
 
     def test_send_echo(self):
-        d = self.gp.echo()
-        self.assertReceived(constants.ECHO_REQ, "hello")
+        self.gp.echo()
+        self.assertReceived(constants.ECHO_REQ, b"hello")
 
     def test_echoRt(self):
         """Test an echo round trip."""
         d = self.gp.echo()
         d.addCallback(lambda x:
                           self.assertEquals(x,
-                                            (constants.ECHO_RES, "hello")))
-        self.write_response(constants.ECHO_RES, "hello")
+                                            (constants.ECHO_RES, b"hello")))
+        self.write_response(constants.ECHO_RES, b"hello")
         return d
 
     def test_register_unsolicited(self):
@@ -119,16 +116,16 @@ class GearmanProtocolTest(ProtocolTestCase):
     def test_unsolicitedCallbackHandling(self):
         d = defer.Deferred()
         self.gp.register_unsolicited(lambda cmd, data: d.callback(True))
-        self.write_response(constants.WORK_COMPLETE, "test\0")
+        self.write_response(constants.WORK_COMPLETE, b"test\0")
         return d
 
 class GearmanJobTest(unittest.TestCase):
 
     def test_constructor(self):
-        gj = client._GearmanJob("footdle\0dys\0some data")
-        self.assertEquals("footdle", gj.handle)
-        self.assertEquals("dys", gj.function)
-        self.assertEquals("some data", gj.data)
+        gj = client._GearmanJob(b"footdle\0dys\0some data")
+        self.assertEquals(b"footdle", gj.handle)
+        self.assertEquals(b"dys", gj.function)
+        self.assertEquals(b"some data", gj.data)
 
         self.assertEquals("<GearmanJob footdle func=dys with 9 bytes of data>",
                           repr(gj))
@@ -141,59 +138,97 @@ class GearmanWorkerTest(ProtocolTestCase):
 
     def test_registerFunction(self):
         self.gw.registerFunction("awesomeness", lambda x: True)
-        self.assertReceived(constants.CAN_DO, "awesomeness")
+        self.assertReceived(constants.CAN_DO, b"awesomeness")
+
+    def test_unregisterFunction(self):
+        self.gw.registerFunction("awesomeness", lambda x: True)
+        self.gw.unregisterFunction("awesomeness")
+        self.assertReceived(constants.CAN_DO, b"awesomeness")
+        self.assertReceived(constants.CANT_DO, b"awesomeness")
+        self.assertEquals([b"awesomeness"], list(self.gw.functions))
+
+    def test_resetAbilities(self):
+        self.gw.registerFunction("awesomeness", lambda x: True)
+        self.gw.resetAbilities()
+        self.assertReceived(constants.CAN_DO, b"awesomeness")
+        self.assertReceived(constants.RESET_ABILITIES, b"")
+        self.assertEquals([b"awesomeness"], list(self.gw.functions))
 
     def test_sendingJobResponse(self):
-        job = client._GearmanJob("test\0blah\0junk")
-        self.gw._send_job_res(constants.WORK_COMPLETE, job, "the value")
-        self.assertReceived(constants.WORK_COMPLETE, "test\0the value")
+        job = client._GearmanJob(b"test\0blah\0junk")
+        self.gw._send_job_res(constants.WORK_COMPLETE, job, b"the value")
+        self.assertReceived(constants.WORK_COMPLETE, b"test\0the value")
 
     def test_sleep(self):
         a = []
         for i in range(5):
             a.append(self.gw._sleep())
+        self.assertReceived(constants.PRE_SLEEP, b"")
+        self.assertEquals([], self.trans.received)
+
+        # a NOOP only wakes the first sleeper
+        self.write_response(constants.NOOP, b"")
+        self.assertEquals([True, False, False, False, False],
+                          [d.called for d in a])
 
-        self.write_response(constants.NOOP, "")
+        self.gw._wake(4)
         return defer.DeferredList(a)
 
+    def test_sleepWakeAll(self):
+        self.gw.wake_all = True
+        a = []
+        for i in range(5):
+            a.append(self.gw._sleep())
+
+        self.write_response(constants.NOOP, b"")
+        return defer.DeferredList(a)
+
+    def test_unsolicitedIgnoresWork(self):
+        d = self.gw._sleep()
+        # meant for a GearmanClient on the same connection
+        self.write_response(constants.WORK_COMPLETE, b"H:1\0done")
+        self.assertFalse(d.called)
+        self.write_response(constants.NOOP, b"")
+        return d
+
     def test_getJob(self):
         d = self.gw.getJob()
         self.write_response(constants.JOB_ASSIGN,
-                            "footdle\0funk\0args and stuff")
+                            b"footdle\0funk\0args and stuff")
         def _handleJob(j):
-            self.assertEquals("footdle", j.handle)
-            self.assertEquals("funk", j.function)
-            self.assertEquals("args and stuff", j.data)
+            self.assertEquals(b"footdle", j.handle)
+            self.assertEquals(b"funk", j.function)
+            self.assertEquals(b"args and stuff", j.data)
 
         d.addCallback(_handleJob)
         return d
 
     def test_getJobWithWaiting(self):
         d = self.gw.getJob()
-        self.write_response(constants.NO_JOB, "")
-        self.write_response(constants.NOOP, "")
+        self.write_response(constants.NO_JOB, b"")
+        self.write_response(constants.NOOP, b"")
         self.write_response(constants.JOB_ASSIGN,
-                            "footdle\0funk\0args and stuff")
+                            b"footdle\0funk\0args and stuff")
         def _handleJob(j):
-            self.assertEquals("footdle", j.handle)
-            self.assertEquals("funk", j.function)
-            self.assertEquals("args and stuff", j.data)
+            self.assertEquals(b"footdle", j.handle)
+            self.assertEquals(b"funk", j.function)
+            self.assertEquals(b"args and stuff", j.data)
 
         d.addCallback(_handleJob)
         return d
 
     def test_getJobWithWaitingMultiNOOP(self):
         d = self.gw.getJob()
-        self.write_response(constants.NO_JOB, "")
-        self.write_response(constants.NOOP, "")
-        self.write_response(constants.NOOP, "")
-        self.write_response(constants.NOOP, "")
+        self.write_response(constants.NO_JOB, b"")
+        self.write_response(constants.NOOP, b"")
+        self.write_response(constants.NOOP, b"")
+        self.write_response(constants.NOOP, b"")
         self.write_response(constants.JOB_ASSIGN,
-                            "footdle\0funk\0args and stuff")
+                            b"footdle\0funk\0args and stuff")
         def _handleJob(j):
-            self.assertEquals("footdle", j.handle)
-            self.assertEquals("funk", j.function)
-            self.assertEquals("args and stuff", j.data)
+            self.assertEquals(b"footdle", j.handle)
+            self.assertEquals(b"funk", j.function)
+            self.assertEquals(b"args and stuff", j.data)
 
         d.addCallback(_handleJob)
         return d
@@ -201,98 +236,201 @@ class GearmanWorkerTest(ProtocolTestCase):
     def test_getJobWhileAlreadyWaiting(self):
         sd = self.gw._sleep()
         d = self.gw.getJob()
-        self.write_response(constants.NOOP, "")
+        # the first NOOP wakes the earlier sleeper, the second wakes us
+        self.write_response(constants.NOOP, b"")
+        self.write_response(constants.NOOP, b"")
         self.write_response(constants.JOB_ASSIGN,
-                            "footdle\0funk\0args and stuff")
+                            b"footdle\0funk\0args and stuff")
         def _handleJob(j):
-            self.assertEquals("footdle", j.handle)
-            self.assertEquals("funk", j.function)
-            self.assertEquals("args and stuff", j.data)
+            self.assertEquals(b"footdle", j.handle)
+            self.assertEquals(b"funk", j.function)
+            self.assertEquals(b"args and stuff", j.data)
 
         d.addCallback(_handleJob)
         return defer.DeferredList([sd, d])
 
+    def test_getJobStepsUp(self):
+        d1 = self.gw.getJob()
+        d2 = self.gw.getJob()
+        self.write_response(constants.NO_JOB, b"")
+        self.write_response(constants.NO_JOB, b"")
+        self.assertReceived(constants.GRAB_JOB, b"")
+        self.assertReceived(constants.GRAB_JOB, b"")
+        self.assertReceived(constants.PRE_SLEEP, b"")
+        self.assertEquals([], self.trans.received)
+
+        # only one GRAB_JOB goes out for the NOOP...
+        self.write_response(constants.NOOP, b"")
+        self.assertReceived(constants.GRAB_JOB, b"")
+        self.assertEquals([], self.trans.received)
+
+        # ...and the second only once the first got a job
+        self.write_response(constants.JOB_ASSIGN, b"h1\0funk\0one")
+        self.assertReceived(constants.GRAB_JOB, b"")
+        self.write_response(constants.JOB_ASSIGN, b"h2\0funk\0two")
+
+        self.assertEquals({'grab_job': 4, 'no_job': 2, 'job_assign': 2,
+                           'noop': 1}, self.gw.counters)
+        d = defer.gatherResults([d1, d2])
+        d.addCallback(lambda jobs:
+                          self.assertEquals([b"h1", b"h2"],
+                                            [j.handle for j in jobs]))
+        return d
+
+    def test_getJobStepUpBackToSleep(self):
+        d1 = self.gw.getJob()
+        d2 = self.gw.getJob()
+        self.write_response(constants.NO_JOB, b"")
+        self.write_response(constants.NO_JOB, b"")
+        self.write_response(constants.NOOP, b"")
+        self.write_response(constants.JOB_ASSIGN, b"h1\0funk\0one")
+        # the second sleeper finds nothing and goes back to sleep
+        self.write_response(constants.NO_JOB, b"")
+        self.trans.received = []
+        self.write_response(constants.NOOP, b"")
+        self.assertReceived(constants.GRAB_JOB, b"")
+        self.write_response(constants.JOB_ASSIGN, b"h2\0funk\0two")
+        return defer.gatherResults([d1, d2])
+
     def test_finishJob(self):
-        self.gw.functions['blah'] = lambda x: x.data.upper()
-        job = client._GearmanJob("test\0blah\0junk")
+        self.gw.functions[b'blah'] = lambda x: x.data.upper()
+        job = client._GearmanJob(b"test\0blah\0junk")
         d = self.gw._finishJob(job)
 
         d.addCallback(lambda x:
                           self.assertReceived(constants.WORK_COMPLETE,
-                                              "test\0JUNK"))
+                                              b"test\0JUNK"))
+
+    def test_getJobSleepsAgainAfterGrab(self):
+        d1 = self.gw.getJob()
+        d2 = self.gw.getJob()
+        # one GRAB_JOB comes back empty while the other is still out
+        self.write_response(constants.NO_JOB, b"")
+        self.trans.received = []
+        # the JOB_ASSIGN wakes the sleeper without a NOOP...
+        self.write_response(constants.JOB_ASSIGN, b"h1\0funk\0one")
+        self.assertReceived(constants.GRAB_JOB, b"")
+        # ...and gearmand stopped thinking we're asleep on that GRAB_JOB
+        self.write_response(constants.NO_JOB, b"")
+        self.assertReceived(constants.PRE_SLEEP, b"")
+        self.assertEquals([], self.trans.received)
+        self.write_response(constants.NOOP, b"")
+        self.assertReceived(constants.GRAB_JOB, b"")
+        self.write_response(constants.JOB_ASSIGN, b"h2\0funk\0two")
+        return defer.gatherResults([d1, d2])
+
+    def test_finishJobUnregistered(self):
+        # the job may have been grabbed before the CANT_DO went out
+        self.gw.registerFunction("blah", lambda x: x.data.upper())
+        self.gw.unregisterFunction("blah")
+        self.trans.received = []
+        job = client._GearmanJob(b"test\0blah\0junk")
+        d = self.gw._finishJob(job)
+
+        d.addCallback(lambda x:
+                          self.assertReceived(constants.WORK_COMPLETE,
+                                              b"test\0JUNK"))
+        return d
+
+    def test_finishJobUnknown(self):
+        job = client._GearmanJob(b"test\0blah\0junk")
+        d = self.gw._finishJob(job)
+
+        def _checkReceived(x):
+            self.assertReceived(constants.WORK_EXCEPTION,
+                                b"test\0" + b"KeyError(b'blah')")
+            self.assertReceived(constants.WORK_FAIL, b"test\0")
+
+        d.addCallback(_checkReceived)
+        return d
+
+    def test_finishJobDisconnected(self):
+        undelivered = []
+        self.gw.undeliverable = lambda *args: undelivered.append(args)
+        self.gw.functions[b'blah'] = lambda x: x.data.upper()
+        job = client._GearmanJob(b"test\0blah\0junk")
+        self.gp.connectionLost(ExpectedFailure())
+        d = self.gw._finishJob(job)
+
+        def _verify(x):
+            self.assertEquals([], self.trans.received)
+            self.assertEquals([(constants.WORK_COMPLETE, job, b"JUNK")],
+                              undelivered)
+        d.addCallback(_verify)
+        return d
 
     def test_finishJobNull(self):
-        self.gw.functions['blah'] = lambda x: None
-        job = client._GearmanJob("test\0blah\0junk")
+        self.gw.functions[b'blah'] = lambda x: None
+        job = client._GearmanJob(b"test\0blah\0junk")
         d = self.gw._finishJob(job)
 
         d.addCallback(lambda x:
                           self.assertReceived(constants.WORK_COMPLETE,
-                                              "test\0"))
+                                              b"test\0"))
 
     def test_finishJobException(self):
         def _failing(x):
             raise Exception("failed")
-        self.gw.functions['blah'] = _failing
-        job = client._GearmanJob("test\0blah\0junk")
+        self.gw.functions[b'blah'] = _failing
+        job = client._GearmanJob(b"test\0blah\0junk")
         d = self.gw._finishJob(job)
 
         def _checkReceived(x):
             self.assertReceived(constants.WORK_EXCEPTION,
-                                "test\0" + 'Exception(failed)')
-            self.assertReceived(constants.WORK_FAIL, "test\0")
+                                b"test\0" + b'Exception(failed)')
+            self.assertReceived(constants.WORK_FAIL, b"test\0")
 
         d.addCallback(_checkReceived)
 
     def test_doJob(self):
-        self.gw.functions['blah'] = lambda x: x.data.upper()
+        self.gw.functions[b'blah'] = lambda x: x.data.upper()
         d = self.gw.doJob()
         self.write_response(constants.JOB_ASSIGN,
-                            "footdle\0blah\0args and stuff")
+                            b"footdle\0blah\0args and stuff")
 
         def _verify(x):
-            self.assertReceived(constants.GRAB_JOB, "")
+            self.assertReceived(constants.GRAB_JOB, b"")
             self.assertReceived(constants.WORK_COMPLETE,
-                                "footdle\0ARGS AND STUFF")
+                                b"footdle\0ARGS AND STUFF")
 
         d.addCallback(_verify)
         return d
 
     def test_doJobs(self):
-        self.gw.functions['blah'] = lambda x: x.data.upper()
-        d = self.gw.doJobs().next()
+        self.gw.functions[b'blah'] = lambda x: x.data.upper()
+        d = next(self.gw.doJobs())
         self.write_response(constants.JOB_ASSIGN,
-                            "footdle\0blah\0args and stuff")
+                            b"footdle\0blah\0args and stuff")
 
         def _verify(x):
-            self.assertReceived(constants.GRAB_JOB, "")
+            self.assertReceived(constants.GRAB_JOB, b"")
             self.assertReceived(constants.WORK_COMPLETE,
-                                "footdle\0ARGS AND STUFF")
+                                b"footdle\0ARGS AND STUFF")
 
         d.addCallback(_verify)
         return d
 
     def test_doJobsNoLoop(self):
         try:
-            d = self.gw.doJobs(lambda: False).next()
+            next(self.gw.doJobs(lambda: False))
         except StopIteration:
             pass
 
     def test_setId(self):
-        self.gw.setId("my id")
-        self.assertReceived(constants.SET_CLIENT_ID, "my id")
+        self.gw.setId(b"my id")
+        self.assertReceived(constants.SET_CLIENT_ID, b"my id")
 
 class GearmanJobHandleTest(unittest.TestCase):
 
     def test_workData(self):
         gjh = client._GearmanJobHandle(None)
-        gjh._work_data.extend(['test', 'ing'])
-        self.assertEquals('testing', gjh.work_data)
+        gjh._work_data.extend([b'test', b'ing'])
+        self.assertEquals(b'testing', gjh.work_data)
 
     def test_workWarning(self):
         gjh = client._GearmanJobHandle(None)
-        gjh._work_warning.extend(['test', 'ing'])
-        self.assertEquals('testing', gjh.work_warning)
+        gjh._work_warning.extend([b'test', b'ing'])
+        self.assertEquals(b'testing', gjh.work_warning)
 
 class GearmanClientTest(ProtocolTestCase):
 
@@ -301,70 +439,77 @@ class GearmanClientTest(ProtocolTestCase):
         self.gc = client.GearmanClient(self.gp)
 
     def test_unsolicitedUnused(self):
-        self.gc._register('x', client._GearmanJobHandle(None))
-        self.gc._unsolicited(constants.WORK_DATA, "x\0some data")
+        self.gc._register(b'x', client._GearmanJobHandle(None))
+        self.gc._unsolicited(constants.WORK_DATA, b"x\0some data")
 
     def test_unsolicitedUnusedNoData(self):
-        self.gc._register('x', client._GearmanJobHandle(None))
-        self.gc._unsolicited(constants.WORK_DATA, "x")
+        self.gc._register(b'x', client._GearmanJobHandle(None))
+        self.gc._unsolicited(constants.WORK_DATA, b"x")
 
     def test_finishJob(self):
         d = defer.Deferred()
-        self.gc._register('x', client._GearmanJobHandle(d))
-        self.gc._unsolicited(constants.WORK_COMPLETE, "x\0some data")
+        self.gc._register(b'x', client._GearmanJobHandle(d))
+        self.gc._unsolicited(constants.WORK_COMPLETE, b"x\0some data")
 
-        d.addCallback(lambda x: self.assertEquals("some data", x))
+        d.addCallback(lambda x: self.assertEquals(b"some data", x))
         return d
 
     def test_failJob(self):
         d = defer.Deferred()
-        self.gc._register('x', client._GearmanJobHandle(d))
-        self.gc._unsolicited(constants.WORK_FAIL, "x\0some data")
+        self.gc._register(b'x', client._GearmanJobHandle(d))
+        self.gc._unsolicited(constants.WORK_FAIL, b"x\0some data")
 
         d.addErrback(lambda x: x.trap(client.GearmanJobFailed))
         return d
 
     def test_submit(self):
-        d = self.gc.submit('test', 'test data')
-        self.assertReceived(constants.SUBMIT_JOB, 'test\0\0test data')
-        self.write_response(constants.JOB_CREATED, 'test_submit')
+        d = self.gc.submit(b'test', b'test data')
+        self.assertReceived(constants.SUBMIT_JOB, b'test\0\0test data')
+        self.write_response(constants.JOB_CREATED, b'test_submit')
         self.write_response(constants.WORK_COMPLETE,
-                            'test_submit\0done')
-        d.addCallback(lambda x: self.assertEquals("done", x))
+                            b'test_submit\0done')
+        d.addCallback(lambda x: self.assertEquals(b"done", x))
         return d
 
     def test_submitHigh(self):
-        d = self.gc.submitHigh('test', 'test data')
-        self.assertReceived(constants.SUBMIT_JOB_HIGH, 'test\0\0test data')
-        self.write_response(constants.JOB_CREATED, 'test_submit')
+        d = self.gc.submitHigh(b'test', b'test data')
+        self.assertReceived(constants.SUBMIT_JOB_HIGH, b'test\0\0test data')
+        self.write_response(constants.JOB_CREATED, b'test_submit')
         self.write_response(constants.WORK_COMPLETE,
-                            'test_submit\0done')
-        d.addCallback(lambda x: self.assertEquals("done", x))
+                            b'test_submit\0done')
+        d.addCallback(lambda x: self.assertEquals(b"done", x))
         return d
 
     def test_submitLow(self):
-        d = self.gc.submitLow('test', 'test data', 'uniqid')
-        self.assertReceived(constants.SUBMIT_JOB_LOW, 'test\0uniqid\0test data')
-        self.write_response(constants.JOB_CREATED, 'test_submit')
+        d = self.gc.submitLow(b'test', b'test data', b'uniqid')
+        self.assertReceived(constants.SUBMIT_JOB_LOW, b'test\0uniqid\0test data')
+        self.write_response(constants.JOB_CREATED, b'test_submit')
         self.write_response(constants.WORK_COMPLETE,
-                            'test_submit\0done')
-        d.addCallback(lambda x: self.assertEquals("done", x))
+                            b'test_submit\0done')
+        d.addCallback(lambda x: self.assertEquals(b"done", x))
+        return d
+
+    def test_getStatus(self):
+        d = self.gc.getStatus(b'H:1')
+        self.assertReceived(constants.GET_STATUS, b'H:1')
+        self.write_response(constants.STATUS_RES, b'H:1\x001\x000\x00\x00')
+        d.addCallback(lambda x: self.assertEquals((True, False, 0, 0), x))
         return d
 
     def test_submitBackground(self):
-        d = self.gc.submitBackground('test', 'test data')
-        self.assertReceived(constants.SUBMIT_JOB_BG, 'test\0\0test data')
-        self.write_response(constants.JOB_CREATED, 'test_submit')
+        d = self.gc.submitBackground(b'test', b'test data')
+        self.assertReceived(constants.SUBMIT_JOB_BG, b'test\0\0test data')
+        self.write_response(constants.JOB_CREATED, b'test_submit')
         return d
 
     def test_submitBackgroundLow(self):
-        d = self.gc.submitBackgroundLow('test', 'test data')
-        self.assertReceived(constants.SUBMIT_JOB_LOW_BG, 'test\0\0test data')
-        self.write_response(constants.JOB_CREATED, 'test_submit')
+        d = self.gc.submitBackgroundLow(b'test', b'test data')
+        self.assertReceived(constants.SUBMIT_JOB_LOW_BG, b'test\0\0test data')
+        self.write_response(constants.JOB_CREATED, b'test_submit')
         return d
 
     def test_submitBackgroundHigh(self):
-        d = self.gc.submitBackgroundHigh('test', 'test data')
-        self.assertReceived(constants.SUBMIT_JOB_HIGH_BG, 'test\0\0test data')
-        self.write_response(constants.JOB_CREATED, 'test_submit')
+        d = self.gc.submitBackgroundHigh(b'test', b'test data')
+        self.assertReceived(constants.SUBMIT_JOB_HIGH_BG, b'test\0\0test data')
+        self.write_response(constants.JOB_CREATED, b'test_submit')
         return d
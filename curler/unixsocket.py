@@ -0,0 +1,39 @@
+from twisted.internet import reactor
+from twisted.internet.endpoints import UNIXClientEndpoint
+from twisted.web.iweb import IAgentEndpointFactory
+from zope.interface import implementer
+
+from .httpclient import HTTPBackend
+
+
+def is_unix_url(url):
+    return url.startswith('unix:')
+
+
+def parse_unix_url(url):
+    """Split 'unix:/run/app.sock:/jobs/method' into the socket path and an
+    HTTP URL for the request, e.g. 'http://localhost/jobs/method'."""
+    socket_path, _, path = url[len('unix:'):].partition(':')
+    return socket_path, 'http://localhost%s' % (path or '/')
+
+
+@implementer(IAgentEndpointFactory)
+class _SocketEndpointFactory(object):
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+
+    def endpointForURI(self, uri):
+        return UNIXClientEndpoint(reactor, self.socket_path)
+
+
+class UnixSocketBackend(HTTPBackend):
+    """POSTs to an HTTP server listening on a Unix domain socket.
+
+    Connections are kept alive and reused between jobs. With accept_gzip,
+    gzip encoded responses are asked for and decompressed."""
+
+    def __init__(self, socket_path, max_connections, accept_gzip=False):
+        self.socket_path = socket_path
+        HTTPBackend.__init__(self, max_connections, accept_gzip,
+                             _SocketEndpointFactory(socket_path))
@@ -0,0 +1,84 @@
+import sys
+from io import BytesIO
+from urllib.parse import urlparse
+from twisted.internet import reactor, threads
+from twisted.python import reflect
+from twisted.python.threadpool import ThreadPool
+
+
+class WSGIDispatcher(object):
+    """Does jobs by calling a WSGI application in-process.
+
+    The application is called on a thread pool with the same POST request
+    curler would otherwise send over HTTP, so it sees the same job_handle
+    and data form fields and headers."""
+
+    def __init__(self, application, num_threads):
+        self.application = application
+        self.pool = ThreadPool(minthreads=1, maxthreads=num_threads,
+                               name='curler-wsgi')
+
+    @classmethod
+    def from_name(cls, name, num_threads):
+        """Load the application from a dotted path like 'myapp.wsgi.app'."""
+        return cls(reflect.namedAny(name), num_threads)
+
+    def start(self):
+        self.pool.start()
+
+    def stop(self):
+        self.pool.stop()
+
+    def post(self, url, postdata, headers):
+        """POST to the application. Fires with (status, headers, response body).
+
+        Header names in the headers dict are lowercase."""
+        return threads.deferToThreadPool(reactor, self.pool, self._call,
+                                         url, postdata, headers)
+
+    def _call(self, url, postdata, headers):
+        parsed = urlparse(url)
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'SCRIPT_NAME': '',
+            'PATH_INFO': parsed.path,
+            'QUERY_STRING': parsed.query,
+            'SERVER_NAME': parsed.hostname or 'localhost',
+            'SERVER_PORT': str(parsed.port or 80),
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'CONTENT_LENGTH': str(len(postdata)),
+            'HTTP_HOST': parsed.netloc,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': parsed.scheme or 'http',
+            'wsgi.input': BytesIO(postdata),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for key, value in headers.items():
+            key = key.upper().replace('-', '_')
+            if key == 'CONTENT_TYPE':
+                environ[key] = value
+            else:
+                environ['HTTP_%s' % key] = value
+
+        started = []
+        body = []
+
+        def start_response(status, response_headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started[:] = [status, dict((name.lower(), value)
+                                       for name, value in response_headers)]
+            return body.append
+
+        result = self.application(environ, start_response)
+        try:
+            for chunk in result:
+                body.append(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+        return int(started[0].split(' ', 1)[0]), started[1], b''.join(body)
@@ -10,7 +10,7 @@ except ImportError:
     raise SystemExit("Twisted not found. Make sure you "
                      "have installed the Twisted core package.")
 
-from distutils.core import setup
+from setuptools import setup
 
 
 def refresh_plugin_cache():
@@ -1,5 +1,5 @@
-from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
-import cgi
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs
 import json
 import sys
 import time
@@ -9,29 +9,28 @@ class TestHandler(BaseHTTPRequestHandler):
 
     def do_POST(self):
         # parse POST data
-        env = {'REQUEST_METHOD': 'POST',
-               'CONTENT_TYPE': self.headers['Content-Type']}
-        form = cgi.FieldStorage(self.rfile, self.headers, environ=env)
+        length = int(self.headers['Content-Length'])
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
 
         content = 'OK'
         code = 200
 
         # special behaviors
         if self.path == '/sleep':
-            data = json.loads(form['data'].value)
+            data = json.loads(form['data'][0])
             time.sleep(int(data['secs']))
         elif self.path == '/fail':
             content = 'FAIL'
             code = 500
 
         # print out the headers so we can verify custom headers are sent
-        print self.headers
+        print(self.headers)
 
         self.send_response(code)
         self.send_header('Content-type', 'text/plain')
         self.end_headers()
-        self.wfile.write(content)
-        self.wfile.write("\nPOST data: %r" % form['data'].value)
+        self.wfile.write(content.encode('utf-8'))
+        self.wfile.write(("\nPOST data: %r" % form['data'][0]).encode('utf-8'))
         return
 
 
@@ -39,10 +38,10 @@ def main():
     try:
         port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
         server = HTTPServer(('', port), TestHandler)
-        print 'Listening on port %d...' % port
+        print('Listening on port %d...' % port)
         server.serve_forever()
-    except KeyboardInterrupt, SystemExit:
-        print 'Stopping server.'
+    except (KeyboardInterrupt, SystemExit):
+        print('Stopping server.')
         server.socket.close()
 
 if __name__ == '__main__':
@@ -1,32 +1,100 @@
 import sys
+from curler.bulkhead import parse_concurrency
+from curler.ratelimit import parse_limits
 from curler.service import CurlerService
 from twisted.application.service import IServiceMaker
 from twisted.plugin import IPlugin
 from twisted.python import usage
-from zope.interface import implements
+from zope.interface import implementer
 
 
 class Options(usage.Options):
     optFlags = [
-        ["verbose", "v", "Verbose logging"]]
+        ["verbose", "v", "Verbose logging"],
+        ["noop-wake-all", None,
+          "Wake every idle worker when gearmand sends a NOOP."],
+        ["accept-gzip", None,
+          "Ask backends for gzip encoded responses."]]
 
     optParameters = [
         ["base-urls", "u", None,
-            "Base paths to web services. Separate multiple with commas."],
+            "Base paths to web services. Separate multiple with commas. "
+            "Use unix:/path/to.sock:/base/path for Unix domain sockets."],
         ["job-queue", "q", "curler",
-            "Job queue to get jobs from."],
+            "Job queues to get jobs from. Separate multiple with commas."],
         ["gearmand-server", "g", "localhost:4730",
           "Gearman job servers. Separate multiple with commas."],
         ["num-workers", "n", 5,
-          "Number of workers (max parallel jobs)."]]
+          "Number of workers (max parallel jobs)."],
+        ["max-workers", None, 0,
+          "Scale workers up to this many based on the queue backlog. "
+          "Requires --status-interval."],
+        ["status-interval", None, 0,
+          "Seconds between gearmand queue status polls (0 to disable)."],
+        ["stats-interval", None, 60,
+          "Seconds between logging stats (0 to disable)."],
+        ["method-rate-limits", None, None,
+          "Requests per second allowed for each method, e.g. "
+          "'do_thing=10,slow_thing=0.5:2'. Separate multiple with commas."],
+        ["backend-rate-limits", None, None,
+          "Requests per second allowed for each base URL, e.g. "
+          "'http://a/jobs=50:100'. Separate multiple with commas."],
+        ["method-concurrency", None, None,
+          "Max parallel jobs per connection for each method, as a count or "
+          "a share of the workers, e.g. 'slow_thing=2,other=25%'."],
+        ["method-queue-size", None, 10,
+          "Jobs per method which may wait locally when the method is at its "
+          "concurrency limit before no more jobs are taken."],
+        ["wsgi-app", None, None,
+          "Dotted path of a WSGI application to call in-process instead of "
+          "POSTing over HTTP, e.g. 'myapp.wsgi.application'."],
+        ["max-job-age", None, 0,
+          "Seconds after a job's enqueued_at time that it expires "
+          "(0 to disable)."],
+        ["spool-file", None, None,
+          "File to keep results in when the gearmand connection drops "
+          "mid-job. They're sent once we reconnect."],
+        ["record-file", None, None,
+          "File to record jobs to for replaying with curler.replay."],
+        ["record-sample-rate", None, 1.0,
+          "Fraction of jobs to record (0 to 1)."],
+        ["profile-dir", None, None,
+          "Directory to write profiles to. Enables profiling on SIGUSR2."],
+        ["profile-seconds", None, 30,
+          "How long to profile for after SIGUSR2."],
+        ["config", "c", None,
+          "JSON file with base-urls, job-queue, num-workers and max-workers "
+          "settings. Reloaded on SIGHUP."],
+        ["drain-timeout", None, 30,
+          "Seconds to let in-flight jobs finish when stopping "
+          "(0 to stop right away)."],
+        ["compress-results", None, 0,
+          "Gzip job results larger than this many bytes (0 to disable)."]]
+
+    def postOptions(self):
+        if int(self['max-workers']) and not int(self['status-interval']):
+            raise usage.UsageError("--max-workers requires --status-interval")
+        if int(self['max-workers']) and \
+                int(self['max-workers']) <= int(self['num-workers']):
+            raise usage.UsageError("--max-workers must be more than "
+                                   "--num-workers")
+        for name in ('method-rate-limits', 'backend-rate-limits'):
+            try:
+                parse_limits(self[name])
+            except ValueError as e:
+                raise usage.UsageError("Bad --%s: %s" % (name, e))
+        try:
+            parse_concurrency(self['method-concurrency'])
+        except ValueError as e:
+            raise usage.UsageError("Bad --method-concurrency: %s" % e)
 
     longdesc = 'curler is a Gearman worker service which does work by hitting \
         a web service. \nPlease see http://github.com/powdahound/curler to \
         report issues or get help.'
 
 
+@implementer(IServiceMaker, IPlugin)
 class CurlerServiceMaker(object):
-    implements(IServiceMaker, IPlugin)
     tapname = "curler"
     description = "A Gearman worker that hits a web service to do work."
     options = Options
@@ -34,16 +102,35 @@ class CurlerServiceMaker(object):
     def makeService(self, options):
         if not options['base-urls'] or not options['gearmand-server'] \
             or not options['job-queue'] or not options['num-workers']:
-            print options
+            print(options)
             sys.exit(1)
 
         base_urls = options['base-urls'].split(',')
         gearmand_servers = options['gearmand-server'].split(',')
-        job_queue = options['job-queue']
+        job_queues = options['job-queue'].split(',')
         num_workers = int(options['num-workers'])
         verbose = bool(options['verbose'])
-        return CurlerService(base_urls, gearmand_servers, job_queue,
-                             num_workers, verbose)
+        stats_interval = int(options['stats-interval'])
+        status_interval = int(options['status-interval'])
+        max_workers = int(options['max-workers'])
+        method_limits = parse_limits(options['method-rate-limits'])
+        backend_limits = parse_limits(options['backend-rate-limits'])
+        method_concurrency = parse_concurrency(options['method-concurrency'])
+        method_queue_size = int(options['method-queue-size'])
+        return CurlerService(base_urls, gearmand_servers, job_queues,
+                             num_workers, verbose, stats_interval,
+                             status_interval, max_workers, method_limits,
+                             backend_limits, method_concurrency,
+                             method_queue_size, options['wsgi-app'],
+                             bool(options['noop-wake-all']),
+                             float(options['max-job-age']),
+                             options['spool-file'], options['record-file'],
+                             float(options['record-sample-rate']),
+                             int(options['profile-seconds']),
+                             options['profile-dir'], options['config'],
+                             int(options['drain-timeout']),
+                             bool(options['accept-gzip']),
+                             int(options['compress-results']))
 
 
 serviceMaker = CurlerServiceMaker()